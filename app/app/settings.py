@@ -95,6 +95,46 @@ DATABASES = {
     }
 }
 
+# Optional read replica for list and analytics reads. Setting
+# DB_REPLICA_HOST=default points the alias at the primary, which is enough
+# to exercise the routing locally without a second server. Requires a
+# shared CACHE_BACKEND, where clients are pinned to the primary after
+# writing.
+DB_REPLICA_HOST = os.environ.get('DB_REPLICA_HOST')
+DB_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+
+if DB_REPLICA_HOST:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'HOST': (DATABASES['default']['HOST']
+                 if DB_REPLICA_HOST == 'default' else DB_REPLICA_HOST),
+        'NAME': os.environ.get('DB_REPLICA_NAME', os.environ.get('DB_NAME')),
+        'USER': os.environ.get('DB_REPLICA_USER', os.environ.get('DB_USER')),
+        'PASSWORD': os.environ.get('DB_REPLICA_PASS', os.environ.get('DB_PASS')),
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+    DATABASE_ROUTERS = ['core.db_routing.PrimaryReplicaRouter']
+    MIDDLEWARE.append('core.db_routing.ReplicaRoutingMiddleware')
+
+# Point CACHE_BACKEND/CACHE_LOCATION at a shared backend (for example
+# django.core.cache.backends.filebased.FileBasedCache on a volume mounted by
+# every service) so cached devices and replica pins are shared between
+# workers. Devices are only cached when the cache is shared.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -133,6 +173,34 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# Media is only served to its owner. Django checks ownership and hands the
+# transfer to nginx's internal location; without nginx (DEBUG) it streams
+# the file itself.
+MEDIA_ACCEL_REDIRECT = os.environ.get(
+    'MEDIA_ACCEL_REDIRECT',
+    '' if DEBUG else '/protected-media/',
+)
+
+# Uploads are streamed to a temporary directory on the media volume, so
+# storing them is a rename instead of a second copy.
+FILE_UPLOAD_HANDLERS = ['core.uploads.StreamingUploadHandler']
+FILE_UPLOAD_TEMP_DIR = os.path.join(MEDIA_ROOT, '.uploads')
+
+UPLOAD_DEFAULT_SIZE_LIMIT = int(
+    os.environ.get('UPLOAD_DEFAULT_SIZE_LIMIT', 10 * 1024 * 1024)
+)
+UPLOAD_SIZE_LIMITS = {
+    'image': int(os.environ.get('UPLOAD_IMAGE_SIZE_LIMIT', 10 * 1024 * 1024)),
+    'related_file': int(
+        os.environ.get('UPLOAD_RELATED_FILE_SIZE_LIMIT', 25 * 1024 * 1024)
+    ),
+}
+# Seconds a resumable upload may go without a new chunk before the
+# purge_uploads job removes it.
+UPLOAD_RESUMABLE_EXPIRY = int(
+    os.environ.get('UPLOAD_RESUMABLE_EXPIRY', 24 * 3600)
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -145,14 +213,38 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    # Reports upload size and checksum errors as 413 and 400
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'core.uploads.StreamingMultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # Requests reach uWSGI from nginx, which passes the client address in
+    # REMOTE_ADDR; a client supplied X-Forwarded-For must not be trusted.
+    'NUM_PROXIES': 0,
+    'DEFAULT_THROTTLE_RATES': {
+        'device_ingest': os.environ.get('THROTTLE_DEVICE_INGEST', '60/min'),
+        # Per device key, or per account token shared by an owner's devices
+        'token_ingest': os.environ.get('THROTTLE_TOKEN_INGEST', '6000/min'),
+        'latest_value': os.environ.get('THROTTLE_LATEST_VALUE', '120/min'),
+    },
 }
 
+# Name of the uWSGI cache holding the throttle token buckets, shared by
+# all workers. Without uWSGI each process keeps its own buckets.
+THROTTLE_UWSGI_CACHE = os.environ.get('THROTTLE_UWSGI_CACHE', 'throttle')
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
 
+# The OpenAPI schema is generated once per code version. APP_VERSION is
+# set by the build (e.g. the git sha); without it the source is hashed.
+APP_VERSION = os.environ.get('APP_VERSION', '')
+SCHEMA_CACHE_DIR = os.environ.get('SCHEMA_CACHE_DIR', '/vol/web/schema')
+
 ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', '')
 
 if ALLOWED_ORIGINS == '*':
@@ -165,4 +257,57 @@ CORS_ALLOW_CREDENTIALS = True
 
 CORS_ALLOW_HEADERS = list(default_headers) + [
     'Authorization',
+    'Idempotency-Key',
 ]
+
+# Seconds a resolved device stays cached for ownership checks when the
+# cache is shared. Changes and deletes invalidate it right away.
+DEVICE_CACHE_TIMEOUT = int(os.environ.get('DEVICE_CACHE_TIMEOUT', 60))
+
+# Seconds the reverse proxy may share public responses (latest-value)
+# between all clients.
+PUBLIC_CACHE_SECONDS = int(os.environ.get('PUBLIC_CACHE_SECONDS', 5))
+
+# Buffered ingestion: when set, device values are spooled to this SQLite
+# file and written to the database by `manage.py flush_ingest_buffer`.
+INGEST_BUFFER_PATH = os.environ.get('INGEST_BUFFER_PATH', '')
+INGEST_BUFFER_BATCH_SIZE = int(os.environ.get('INGEST_BUFFER_BATCH_SIZE', 1000))
+INGEST_BUFFER_FLUSH_INTERVAL = float(
+    os.environ.get('INGEST_BUFFER_FLUSH_INTERVAL', 1)
+)
+
+# Devices may send the capture time of a reading (taken_at). It may run
+# ahead of the server clock by INGEST_MAX_CLOCK_SKEW seconds, and readings
+# replayed after an outage are accepted up to INGEST_MAX_BACKFILL_AGE
+# seconds back.
+INGEST_MAX_CLOCK_SKEW = int(os.environ.get('INGEST_MAX_CLOCK_SKEW', 300))
+INGEST_MAX_BACKFILL_AGE = int(
+    os.environ.get('INGEST_MAX_BACKFILL_AGE', 7 * 24 * 60 * 60)
+)
+# Largest batch accepted by the bulk value endpoint
+INGEST_BULK_MAX_READINGS = int(
+    os.environ.get('INGEST_BULK_MAX_READINGS', 1000)
+)
+
+# Job queue worker (`manage.py run_jobs`). Failed jobs are retried after
+# JOB_RETRY_DELAY seconds, doubling up to JOB_RETRY_MAX_DELAY. Workers
+# refresh the claim of a running job every JOB_HEARTBEAT_INTERVAL seconds
+# and requeue jobs whose claim was not refreshed for JOB_TIMEOUT seconds,
+# as their worker was killed.
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 10))
+JOB_RETRY_MAX_DELAY = int(os.environ.get('JOB_RETRY_MAX_DELAY', 3600))
+JOB_HEARTBEAT_INTERVAL = int(os.environ.get('JOB_HEARTBEAT_INTERVAL', 30))
+JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 300))
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+
+# MQTT ingestion gateway (`manage.py mqtt_gateway`). The + in MQTT_TOPIC
+# matches the device id.
+MQTT_HOST = os.environ.get('MQTT_HOST', 'mosquitto')
+MQTT_PORT = int(os.environ.get('MQTT_PORT', 1883))
+MQTT_USERNAME = os.environ.get('MQTT_USERNAME', '')
+MQTT_PASSWORD = os.environ.get('MQTT_PASSWORD', '')
+MQTT_CLIENT_ID = os.environ.get('MQTT_CLIENT_ID', 'ingest-gateway')
+MQTT_TOPIC = os.environ.get('MQTT_TOPIC', 'devices/+/values')
+MQTT_BATCH_SIZE = int(os.environ.get('MQTT_BATCH_SIZE', 500))
+MQTT_FLUSH_INTERVAL = float(os.environ.get('MQTT_FLUSH_INTERVAL', 1))
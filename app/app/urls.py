@@ -1,29 +1,26 @@
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
+from drf_spectacular.views import SpectacularSwaggerView
 from django.contrib import admin
 from django.urls import path, include
-from django.conf.urls.static import static
 from django.conf import settings
 
 from core import views
+from core.schema import CachedSpectacularAPIView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path(
         'api/schema',
-        SpectacularAPIView.as_view(),
+        CachedSpectacularAPIView.as_view(),
         name='schema'),
     path(
         'api/docs/',
         SpectacularSwaggerView.as_view(),
         name='api-docs'),
     path('api/user/', include('user.urls')),
+    path('healthz', views.healthz, name='healthz'),
+    path('readyz', views.readyz, name='readyz'),
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}<path:path>',
+        views.protected_media,
+        name='media'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL,
-        document_root=settings.MEDIA_ROOT,
-    )
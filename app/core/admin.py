@@ -48,3 +48,5 @@ class UserAdmin(BaseUserAdmin):
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.IoTDevice)
 admin.site.register(models.DeviceValue)
+admin.site.register(models.DeviceAPIKey)
+admin.site.register(models.Job)
@@ -0,0 +1,41 @@
+"""
+Shared cache headers for public read endpoints, and helpers for the
+default cache
+"""
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+
+def cache_publicly(response, *surrogate_keys):
+    """Let the proxy share response between clients for a short time.
+
+    Surrogate keys tag the cached response (e.g. per device) so a CDN
+    that supports them can purge everything related to one object.
+    """
+    seconds = settings.PUBLIC_CACHE_SECONDS
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=seconds,
+        s_maxage=seconds,
+        stale_while_revalidate=seconds,
+    )
+    patch_vary_headers(response, ['Accept'])
+    if surrogate_keys:
+        response['Surrogate-Key'] = ' '.join(surrogate_keys)
+    return response
+
+
+# Backends whose entries are only seen by the process that wrote them
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+}
+
+
+def cache_is_shared():
+    """Return whether every worker sees the same default cache.
+
+    Invalidations made by one uWSGI worker only reach the others through
+    a shared cache, so authorisation data must not be cached otherwise.
+    """
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
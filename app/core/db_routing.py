@@ -0,0 +1,85 @@
+"""
+Primary/replica database routing.
+
+While a request is safe (GET, HEAD, OPTIONS), reads of the API data models
+go to the ``replica`` alias. Writes, unsafe requests and anything outside
+a request (commands, shell) use ``default``. A client that just wrote is
+pinned to the primary for DB_REPLICA_PIN_SECONDS so it reads its own
+writes. Pins are kept in the default cache, which must be shared by all
+workers for the next request to see them.
+"""
+import contextvars
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+from core import caching
+
+REPLICA_ALIAS = 'replica'
+
+# Models that are safe to serve from a lagging copy. Auth data (users,
+# tokens, sessions) always comes from the primary.
+REPLICA_MODELS = {
+    'core.iotdevice',
+    'core.devicevalue',
+    'core.todolist',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+def pin_key(request):
+    """Return the cache key pinning the client of request to the primary"""
+    identity = (request.META.get('HTTP_AUTHORIZATION')
+                or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not identity:
+        return None
+    return f'db-pin:{hashlib.sha256(identity.encode()).hexdigest()}'
+
+
+class ReplicaRoutingMiddleware:
+    """Decide once per request whether its reads may use the replica"""
+
+    def __init__(self, get_response):
+        if not caching.cache_is_shared():
+            raise ImproperlyConfigured(
+                'Replica routing pins clients in the default cache, set '
+                'CACHE_BACKEND to a cache shared by all workers.'
+            )
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = pin_key(request)
+        safe = request.method in SAFE_METHODS
+        pinned = key is not None and cache.get(key) is not None
+        token = _use_replica.set(safe and not pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+
+        if not safe and key is not None:
+            cache.set(key, True, settings.DB_REPLICA_PIN_SECONDS)
+        return response
+
+
+class PrimaryReplicaRouter:
+    """Send safe reads to the replica and everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and model._meta.label_lower in REPLICA_MODELS:
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,18 @@
+"""
+Cheap database connectivity probe shared by wait_for_db and /readyz
+"""
+from psycopg2 import OperationalError as Psycopg2OpError
+
+from django.db import connections
+from django.db.utils import Error
+
+
+def database_available(alias='default'):
+    """Return True if a trivial query succeeds on the database"""
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except (Error, Psycopg2OpError):
+        connections[alias].close()
+        return False
+    return True
@@ -0,0 +1,299 @@
+"""
+Database backed job queue.
+
+Jobs are rows of core.Job. Workers (``manage.py run_jobs``) claim the next
+due job with ``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of them
+can poll the table without a broker and without blocking each other.
+Failed jobs are retried with exponential backoff, periodic jobs queue their
+next run when they finish, and a job type may limit how many of its jobs
+run at the same time across all workers.
+
+A running job's ``locked_at`` is its claim. The worker refreshes it every
+JOB_HEARTBEAT_INTERVAL seconds, jobs whose claim is older than JOB_TIMEOUT
+are requeued, and a worker whose claim was taken over stores nothing.
+
+Job types are functions registered with ``@job`` in a ``jobs`` module of
+any installed app; the payload is passed as keyword arguments.
+"""
+import logging
+import threading
+import traceback
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core import rollups, uploads
+from core.models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+class JobType:
+    """A registered job function and how it is run"""
+
+    def __init__(self, func, name, max_attempts, concurrency, every):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+        self.every = every
+
+
+def job(name=None, max_attempts=5, concurrency=None, every=None):
+    """Register a function as a job type.
+
+    ``concurrency`` limits how many jobs of the type run at once and
+    ``every`` (a timedelta) runs it periodically.
+    """
+    def register(func):
+        job_name = name or func.__name__
+        registry[job_name] = JobType(
+            func,
+            job_name,
+            max_attempts,
+            concurrency,
+            every,
+        )
+        return func
+    return register
+
+
+def discover():
+    """Import the jobs module of every installed app"""
+    autodiscover_modules('jobs')
+
+
+def enqueue(name, payload=None, run_at=None, key=None):
+    """Queue a job; with a key it is skipped while one is pending"""
+    job_type = registry.get(name)
+    new_job = Job(
+        name=name,
+        payload=payload or {},
+        run_at=run_at or timezone.now(),
+        key=key,
+        max_attempts=job_type.max_attempts if job_type else 5,
+    )
+    # The active key constraint turns a duplicate into ON CONFLICT DO NOTHING
+    Job.objects.bulk_create([new_job], ignore_conflicts=key is not None)
+
+
+def schedule_periodic():
+    """Queue a first run of periodic job types that have none pending"""
+    for job_type in registry.values():
+        if job_type.every:
+            enqueue(job_type.name, key=f'periodic:{job_type.name}')
+
+
+def backoff(attempts):
+    """Return the delay before retrying a job that failed attempts times"""
+    return timedelta(seconds=min(
+        settings.JOB_RETRY_MAX_DELAY,
+        settings.JOB_RETRY_DELAY * 2 ** (attempts - 1),
+    ))
+
+
+def lock_job_type(name):
+    """Serialize claims of one job type until the transaction ends"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(%s)',
+                [zlib.crc32(name.encode())],
+            )
+
+
+def claim():
+    """Mark the next due job running and return it, or None"""
+    now = timezone.now()
+    limited = {
+        job_type.name: job_type.concurrency
+        for job_type in registry.values()
+        if job_type.concurrency
+    }
+    with transaction.atomic():
+        running = dict(
+            Job.objects.filter(state=Job.RUNNING, name__in=limited)
+            .values_list('name')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        full = [
+            name for name, limit in limited.items()
+            if running.get(name, 0) >= limit
+        ]
+        due = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(state=Job.QUEUED, run_at__lte=now)
+            .exclude(name__in=full)
+            .order_by('run_at', 'id')
+            .first()
+        )
+        if due is None:
+            return None
+
+        if due.name in limited:
+            # Count again under the lock, other workers may have claimed
+            lock_job_type(due.name)
+            running = Job.objects.filter(
+                state=Job.RUNNING,
+                name=due.name,
+            ).count()
+            if running >= limited[due.name]:
+                return None
+
+        due.state = Job.RUNNING
+        due.locked_at = now
+        due.attempts += 1
+        due.save(update_fields=['state', 'locked_at', 'attempts'])
+    return due
+
+
+def finish(claimed, job_type, error=None):
+    """Store the outcome of a job and queue its retry or next run.
+
+    Returns False without storing anything when the claim was lost, i.e.
+    the job was requeued as stale meanwhile.
+    """
+    now = timezone.now()
+    claim = claimed.locked_at
+    claimed.locked_at = None
+    if error is None:
+        claimed.state = Job.DONE
+        claimed.finished_at = now
+    else:
+        claimed.last_error = error
+        if claimed.attempts < claimed.max_attempts:
+            claimed.state = Job.QUEUED
+            claimed.run_at = now + backoff(claimed.attempts)
+        else:
+            claimed.state = Job.FAILED
+            claimed.finished_at = now
+    updated = Job.objects.filter(
+        pk=claimed.pk,
+        state=Job.RUNNING,
+        locked_at=claim,
+    ).update(
+        state=claimed.state,
+        locked_at=None,
+        last_error=claimed.last_error,
+        run_at=claimed.run_at,
+        finished_at=claimed.finished_at,
+    )
+    if not updated:
+        logger.warning('Job %s (%s) lost its claim', claimed.pk, claimed.name)
+        return False
+
+    if job_type and job_type.every and claimed.finished_at:
+        enqueue(
+            job_type.name,
+            run_at=now + job_type.every,
+            key=f'periodic:{job_type.name}',
+        )
+    return True
+
+
+class Heartbeat(threading.Thread):
+    """Refresh the claim of a running job, so it is not requeued as stale"""
+
+    def __init__(self, claimed):
+        super().__init__(name=f'job-{claimed.pk}-heartbeat', daemon=True)
+        self.claimed = claimed
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            interval = settings.JOB_HEARTBEAT_INTERVAL
+            while not self.stopped.wait(interval):
+                now = timezone.now()
+                if not Job.objects.filter(
+                    pk=self.claimed.pk,
+                    state=Job.RUNNING,
+                    locked_at=self.claimed.locked_at,
+                ).update(locked_at=now):
+                    return
+                self.claimed.locked_at = now
+        finally:
+            # The thread has its own connection
+            connection.close()
+
+    def stop(self):
+        """Stop refreshing and wait for the last refresh to finish"""
+        self.stopped.set()
+        self.join()
+
+
+def run(claimed):
+    """Run a claimed job"""
+    job_type = registry.get(claimed.name)
+    if job_type is None:
+        claimed.max_attempts = claimed.attempts
+        finish(claimed, None, f'Unknown job type {claimed.name}')
+        return
+
+    heartbeat = Heartbeat(claimed)
+    heartbeat.start()
+    try:
+        job_type.func(**claimed.payload)
+    except Exception:
+        logger.exception('Job %s (%s) failed', claimed.pk, claimed.name)
+        error = traceback.format_exc()
+    else:
+        error = None
+    finally:
+        heartbeat.stop()
+    finish(claimed, job_type, error)
+
+
+def work():
+    """Claim and run one job, return it or None when nothing is due"""
+    claimed = claim()
+    if claimed is not None:
+        run(claimed)
+    return claimed
+
+
+def requeue_stale():
+    """Give jobs of workers that stopped refreshing their claim another go"""
+    stale = Job.objects.select_for_update(skip_locked=True).filter(
+        state=Job.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(
+            seconds=settings.JOB_TIMEOUT,
+        ),
+    )
+    with transaction.atomic():
+        for claimed in stale:
+            finish(
+                claimed,
+                registry.get(claimed.name),
+                'Worker stopped refreshing its claim',
+            )
+
+
+@job(every=timedelta(minutes=1), concurrency=1)
+def refresh_traffic_rollups():
+    """Refresh the hourly traffic rollups"""
+    rollups.refresh_hourly()
+
+
+@job(every=timedelta(hours=1), concurrency=1)
+def purge_jobs():
+    """Delete finished jobs past the retention period"""
+    Job.objects.filter(
+        state__in=[Job.DONE, Job.FAILED],
+        finished_at__lt=timezone.now() - timedelta(
+            days=settings.JOB_RETENTION_DAYS,
+        ),
+    ).delete()
+
+
+@job(every=timedelta(hours=1), concurrency=1)
+def purge_uploads():
+    """Delete resumable uploads abandoned past their expiry"""
+    uploads.purge_abandoned()
@@ -0,0 +1,50 @@
+"""
+Django command to run collectstatic only when static files changed
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+MANIFEST_NAME = '.collectstatic-manifest'
+IGNORE_PATTERNS = ['CVS', '.*', '*~']
+
+
+def static_manifest():
+    """Return a hash of every static source file's path, size and mtime"""
+    digest = hashlib.sha256()
+    entries = []
+    for finder in get_finders():
+        for path, storage in finder.list(IGNORE_PATTERNS):
+            stat = os.stat(storage.path(path))
+            entries.append(f'{path}:{stat.st_size}:{stat.st_mtime_ns}')
+    for entry in sorted(entries):
+        digest.update(entry.encode())
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    """Django command to skip collectstatic when STATIC_ROOT is current"""
+
+    def handle(self, *args, **options):
+        """Entrypoint for commands"""
+        manifest_path = os.path.join(settings.STATIC_ROOT, MANIFEST_NAME)
+        manifest = static_manifest()
+
+        try:
+            with open(manifest_path) as manifest_file:
+                current = manifest_file.read().strip()
+        except OSError:
+            current = None
+
+        if current == manifest:
+            self.stdout.write('Static files up to date')
+            return
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(manifest_path, 'w') as manifest_file:
+            manifest_file.write(manifest)
+        self.stdout.write(self.style.SUCCESS('Static files collected'))
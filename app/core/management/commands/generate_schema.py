@@ -0,0 +1,29 @@
+"""
+Django command to precompute the OpenAPI schema
+"""
+import os
+
+from django.core.management.base import BaseCommand
+
+from core.schema import code_version, generate_schema, schema_path
+
+
+class Command(BaseCommand):
+    """Django command to generate the schema of the current code version"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate even if the schema of this version exists.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for commands"""
+        version = code_version()
+        if not options['force'] and os.path.exists(schema_path(version)):
+            self.stdout.write(f'Schema {version} up to date')
+            return
+
+        generate_schema()
+        self.stdout.write(self.style.SUCCESS(f'Schema {version} generated'))
@@ -0,0 +1,43 @@
+"""
+Django command to refresh the hourly traffic rollups used by Grafana
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    """Django command to refresh DeviceTrafficHourly"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every hour instead of only the newest ones.',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep refreshing every --interval seconds.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=60,
+            help='Seconds between refreshes when looping.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for commands"""
+        full = options['full']
+        while True:
+            written = rollups.refresh_hourly(full=full)
+            self.stdout.write(self.style.SUCCESS(
+                f'Refreshed {written} hourly rollups'
+            ))
+            if not options['loop']:
+                break
+            full = False
+            time.sleep(options['interval'])
@@ -0,0 +1,75 @@
+"""
+Django command to run queued background jobs
+"""
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    """Django command to work through the job queue"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run every due job and exit instead of polling.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.JOB_POLL_INTERVAL,
+            help='Seconds to wait between polls when no job is due.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for commands"""
+        jobs.discover()
+        jobs.schedule_periodic()
+        self.stdout.write(f'Running jobs: {", ".join(sorted(jobs.registry))}')
+
+        # On SIGTERM (docker stop) or SIGINT the current job is finished
+        # first, so it is not left running until it counts as stale.
+        self.stopping = threading.Event()
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                handlers[signum] = signal.signal(signum, self.stop)
+        try:
+            self.work(options['once'], options['interval'])
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write('Stopped')
+
+    def work(self, once, interval):
+        """Run due jobs until stopped, or until none is due with once"""
+        requeued_at = None
+        while not self.stopping.is_set():
+            # Also while jobs are due, a busy queue must not keep stale
+            # ones from running again.
+            now = time.monotonic()
+            if (requeued_at is None
+                    or now - requeued_at >= settings.JOB_HEARTBEAT_INTERVAL):
+                jobs.requeue_stale()
+                requeued_at = now
+
+            claimed = jobs.work()
+            if claimed is not None:
+                self.stdout.write(
+                    f'Job {claimed.pk} ({claimed.name}): {claimed.state}'
+                )
+                continue
+            if once:
+                break
+            self.stopping.wait(interval)
+
+    def stop(self, signum, frame):
+        """Finish the running job, then exit"""
+        self.stdout.write(f'Stopping after the current job ({signum})')
+        self.stopping.set()
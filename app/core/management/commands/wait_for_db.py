@@ -1,28 +1,61 @@
 """
 Django command to pause execution until database is available
 """
-
+import random
 import time
 
-from psycopg2 import OperationalError as Psycopg2OpError
+from django.core.management.base import BaseCommand, CommandError
 
-from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from core.health import database_available
 
 
 class Command(BaseCommand):
     """Django command to wait for the database to be available"""
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Database alias to wait for.',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=120,
+            help='Seconds to wait before giving up, 0 waits forever.',
+        )
+        parser.add_argument(
+            '--base-delay',
+            type=float,
+            default=0.25,
+            help='Seconds to wait after the first failed attempt.',
+        )
+        parser.add_argument(
+            '--max-delay',
+            type=float,
+            default=5,
+            help='Upper bound for the delay between attempts.',
+        )
+
     def handle(self, *args, **options):
         """Entrypoint for commands"""
         self.stdout.write('Waiting for database...')
-        db_up = False
-        while not db_up:
-            try:
-                self.check(databases=['default'])
-                db_up = True
-            except (OperationalError, Psycopg2OpError):
-                self.stdout.write(self.style.ERROR('Database not available,'
-                                                   'waiting for 1 second'))
-                time.sleep(1)
-            self.stdout.write(self.style.SUCCESS('Database available'))
+        timeout = options['timeout']
+        deadline = time.monotonic() + timeout if timeout else None
+        delay = options['base_delay']
+
+        while not database_available(options['database']):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise CommandError(
+                    f'Database not available after {timeout:g} seconds'
+                )
+            # Exponential backoff with jitter, so replicas starting together
+            # do not hammer the database in lockstep.
+            wait = delay / 2 + random.uniform(0, delay / 2)
+            self.stdout.write(self.style.ERROR(
+                f'Database not available, waiting {wait:.2f} seconds'
+            ))
+            time.sleep(wait)
+            delay = min(delay * 2, options['max_delay'])
+
+        self.stdout.write(self.style.SUCCESS('Database available'))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_todolist'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceTrafficHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('samples', models.IntegerField(default=0)),
+                ('avg_value', models.FloatField(default=0)),
+                ('max_value', models.IntegerField(default=0)),
+                ('car_count', models.IntegerField(default=0)),
+                ('motorcycle_count', models.IntegerField(default=0)),
+                ('smalltruck_count', models.IntegerField(default=0)),
+                ('bigvehicle_count', models.IntegerField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_traffic', to='core.iotdevice')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'bucket'), name='unique_device_traffic_hour')],
+            },
+        ),
+    ]
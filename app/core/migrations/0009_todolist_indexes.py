@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_devicetraffichourly'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todolist',
+            index=models.Index(fields=['user', '-created_at'], name='todo_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todolist',
+            index=models.Index(fields=['user', 'is_completed', 'due_date'], name='todo_user_done_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todolist',
+            index=models.Index(condition=models.Q(('is_completed', False)), fields=['user', 'due_date'], name='todo_user_open_due_idx'),
+        ),
+    ]
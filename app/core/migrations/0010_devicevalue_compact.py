@@ -0,0 +1,275 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:55
+
+import re
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+TABLE = 'core_devicevalue'
+COMPACT = 'core_devicevalue_compact'
+BATCH_SIZE = 50000
+
+SMALL_COLUMNS = [
+    'value',
+    'car_count',
+    'motorcycle_count',
+    'smalltruck_count',
+    'bigvehicle_count',
+]
+
+# 8 byte columns first, then the 2 byte ones, then the variable length
+# image, so PostgreSQL does not need to pad any column for alignment.
+COLUMNS = ['id', 'taken_at', 'device_id', 'user_id'] + SMALL_COLUMNS + [
+    'image',
+]
+
+CREATE_COMPACT = """
+CREATE TABLE {compact} (
+    id bigint GENERATED BY DEFAULT AS IDENTITY NOT NULL,
+    taken_at timestamp with time zone NOT NULL,
+    device_id bigint NOT NULL,
+    user_id bigint NULL,
+    value smallint NOT NULL,
+    car_count smallint NOT NULL,
+    motorcycle_count smallint NOT NULL,
+    smalltruck_count smallint NOT NULL,
+    bigvehicle_count smallint NOT NULL,
+    image varchar(100) NULL,
+    {checks},
+    CONSTRAINT devicevalue_value_range CHECK (value <= 5)
+)
+"""
+
+# Mirrors every write to the old table while it is being copied
+CREATE_SYNC_TRIGGER = """
+CREATE FUNCTION {compact}_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM {compact} WHERE id = OLD.id;
+        RETURN OLD;
+    END IF;
+    INSERT INTO {compact} ({columns})
+    VALUES ({new_columns})
+    ON CONFLICT (id) DO UPDATE SET {updates};
+    RETURN NEW;
+END
+$$;
+CREATE TRIGGER {compact}_sync
+AFTER INSERT OR UPDATE OR DELETE ON {table}
+FOR EACH ROW EXECUTE FUNCTION {compact}_sync();
+"""
+
+DROP_SYNC_TRIGGER = """
+DROP TRIGGER IF EXISTS {compact}_sync ON {table};
+DROP FUNCTION IF EXISTS {compact}_sync();
+"""
+
+
+def temporary_name(name):
+    """Return the name an index has on the compact table until the swap"""
+    return f'{name[:59]}_cmp'
+
+
+def rebuild_table(schema_editor):
+    """Rebuild the table with compact columns while it stays writable.
+
+    A trigger mirrors writes into the new table while existing rows are
+    copied in batches. Only the final swap takes a short exclusive lock,
+    and foreign keys are validated after it without blocking writes.
+    """
+    connection = schema_editor.connection
+    names = {
+        'table': TABLE,
+        'compact': COMPACT,
+        'columns': ', '.join(COLUMNS),
+        'new_columns': ', '.join(f'NEW.{column}' for column in COLUMNS),
+        'updates': ', '.join(
+            f'{column} = EXCLUDED.{column}' for column in COLUMNS[1:]
+        ),
+        'checks': ',\n    '.join(
+            f'CONSTRAINT {schema_editor._create_index_name(TABLE, [column], suffix="_check")} '
+            f'CHECK ({column} >= 0)'
+            for column in SMALL_COLUMNS
+        ),
+    }
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_constraint WHERE confrelid = %s::regclass',
+            [TABLE],
+        )
+        if cursor.fetchone():
+            raise RuntimeError(f'{TABLE} is referenced by foreign keys.')
+
+        cursor.execute(
+            f'SELECT COUNT(*) FROM {TABLE} WHERE value NOT BETWEEN 0 AND 5 '
+            + ''.join(
+                f'OR {column} NOT BETWEEN 0 AND 32767 '
+                for column in SMALL_COLUMNS[1:]
+            )
+        )
+        invalid = cursor.fetchone()[0]
+        if invalid:
+            raise RuntimeError(
+                f'{invalid} rows of {TABLE} have a value outside 0-5 or a '
+                'vehicle count outside 0-32767, fix them before migrating.'
+            )
+
+        cursor.execute(
+            'SELECT indexname, indexdef FROM pg_indexes '
+            'WHERE schemaname = current_schema() AND tablename = %s',
+            [TABLE],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(CREATE_COMPACT.format(**names))
+        for name, definition in indexes:
+            definition = re.sub(
+                rf' INDEX {re.escape(name)} ON (\S+\.)?{TABLE} ',
+                rf' INDEX {temporary_name(name)} ON \g<1>{COMPACT} ',
+                definition,
+            )
+            cursor.execute(definition)
+
+        try:
+            cursor.execute(CREATE_SYNC_TRIGGER.format(**names))
+            cursor.execute(f'SELECT MIN(id), MAX(id) FROM {TABLE}')
+            first, last = cursor.fetchone()
+            start = first or 0
+            while last is not None and start <= last:
+                # Locking the copied rows makes concurrent deletes wait
+                # for the batch, so their trigger sees the copied row.
+                cursor.execute(
+                    f'INSERT INTO {COMPACT} ({names["columns"]}) '
+                    f'SELECT {names["columns"]} FROM {TABLE} '
+                    'WHERE id >= %s AND id < %s FOR KEY SHARE '
+                    'ON CONFLICT (id) DO NOTHING',
+                    [start, start + BATCH_SIZE],
+                )
+                start += BATCH_SIZE
+        except Exception:
+            cursor.execute(DROP_SYNC_TRIGGER.format(**names))
+            cursor.execute(f'DROP TABLE {COMPACT}')
+            raise
+
+        with transaction.atomic(using=connection.alias):
+            cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+            cursor.execute(
+                'SELECT setval(pg_get_serial_sequence(%s, %s), '
+                'nextval(pg_get_serial_sequence(%s, %s)), false)',
+                [COMPACT, 'id', TABLE, 'id'],
+            )
+            cursor.execute(DROP_SYNC_TRIGGER.format(**names))
+            cursor.execute(f'DROP TABLE {TABLE}')
+            cursor.execute(f'ALTER TABLE {COMPACT} RENAME TO {TABLE}')
+            cursor.execute(
+                f'ALTER SEQUENCE {COMPACT}_id_seq RENAME TO {TABLE}_id_seq'
+            )
+            for name, definition in indexes:
+                if name == f'{TABLE}_pkey':
+                    cursor.execute(
+                        f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} '
+                        f'PRIMARY KEY USING INDEX {temporary_name(name)}'
+                    )
+                else:
+                    cursor.execute(
+                        f'ALTER INDEX {temporary_name(name)} RENAME TO {name}'
+                    )
+            for name, definition in foreign_keys:
+                cursor.execute(
+                    f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} '
+                    f'{definition} NOT VALID'
+                )
+
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {TABLE} VALIDATE CONSTRAINT {name}')
+        cursor.execute(f'ANALYZE {TABLE}')
+
+
+class CompactDeviceValue(migrations.SeparateDatabaseAndState):
+    """Apply the operations in place, or by an online rebuild on PostgreSQL"""
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            rebuild_table(schema_editor)
+            return
+        for operation in self.state_operations:
+            to_state = from_state.clone()
+            operation.state_forwards(app_label, to_state)
+            operation.database_forwards(
+                app_label, schema_editor, from_state, to_state,
+            )
+            from_state = to_state
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        # Reverting changes the column types back in place
+        to_states = {}
+        for operation in self.state_operations:
+            to_states[operation] = to_state
+            to_state = to_state.clone()
+            operation.state_forwards(app_label, to_state)
+        for operation in reversed(self.state_operations):
+            from_state = to_state
+            to_state = to_states[operation]
+            operation.database_backwards(
+                app_label, schema_editor, from_state, to_state,
+            )
+
+
+class Migration(migrations.Migration):
+
+    # The online rebuild commits its copy batches separately
+    atomic = False
+
+    dependencies = [
+        ('core', '0009_todolist_indexes'),
+    ]
+
+    operations = [
+        CompactDeviceValue(state_operations=[
+            migrations.AlterField(
+                model_name='devicevalue',
+                name='bigvehicle_count',
+                field=models.PositiveSmallIntegerField(default=0),
+            ),
+            migrations.AlterField(
+                model_name='devicevalue',
+                name='car_count',
+                field=models.PositiveSmallIntegerField(default=0),
+            ),
+            migrations.AlterField(
+                model_name='devicevalue',
+                name='motorcycle_count',
+                field=models.PositiveSmallIntegerField(default=0),
+            ),
+            migrations.AlterField(
+                model_name='devicevalue',
+                name='smalltruck_count',
+                field=models.PositiveSmallIntegerField(default=0),
+            ),
+            migrations.AlterField(
+                model_name='devicevalue',
+                name='user',
+                field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+            ),
+            migrations.AlterField(
+                model_name='devicevalue',
+                name='value',
+                field=models.PositiveSmallIntegerField(default=0, validators=[django.core.validators.MaxValueValidator(5)]),
+            ),
+            migrations.AddConstraint(
+                model_name='devicevalue',
+                constraint=models.CheckConstraint(condition=models.Q(('value__lte', 5)), name='devicevalue_value_range'),
+            ),
+        ]),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # core_devicevalue keeps taking writes while the index is built
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_devicevalue_compact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicevalue',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        # The partial unique constraint is a unique index in PostgreSQL.
+        # AddIndexConcurrently cannot build unique indexes, so the same
+        # index is created concurrently by hand and the constraint is only
+        # added to the state, where ON CONFLICT finds it.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE UNIQUE INDEX CONCURRENTLY '
+                        'devicevalue_idempotency_key '
+                        'ON core_devicevalue (device_id, idempotency_key) '
+                        'WHERE idempotency_key IS NOT NULL',
+                    reverse_sql='DROP INDEX CONCURRENTLY '
+                                'devicevalue_idempotency_key',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='devicevalue',
+                    constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('device', 'idempotency_key'), name='devicevalue_idempotency_key'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:13
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # core_devicevalue keeps taking writes while the index is built
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_devicevalue_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceTrafficDirtyHour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='devicevalue',
+            name='taken_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        AddIndexConcurrently(
+            model_name='devicevalue',
+            index=models.Index(fields=['device', '-taken_at'], name='devicevalue_device_taken_idx'),
+        ),
+        migrations.AddField(
+            model_name='devicetrafficdirtyhour',
+            name='device',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.iotdevice'),
+        ),
+        migrations.AddConstraint(
+            model_name='devicetrafficdirtyhour',
+            constraint=models.UniqueConstraint(fields=('device', 'bucket'), name='unique_device_dirty_hour'),
+        ),
+    ]
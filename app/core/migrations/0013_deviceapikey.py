@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_devicevalue_capture_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceAPIKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('prefix', models.CharField(max_length=8, unique=True)),
+                ('digest', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='api_keys', to='core.iotdevice')),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:02
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # core_devicevalue keeps taking writes while the index is built
+    atomic = False
+
+    dependencies = [
+        ('core', '0014_job'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='devicevalue',
+            index=models.Index(condition=models.Q(('image', ''), _negated=True), fields=['image'], name='devicevalue_image_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:09
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # core_devicevalue keeps taking writes while the index is built
+    atomic = False
+
+    dependencies = [
+        ('core', '0015_devicevalue_image_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='devicevalue',
+            index=django.contrib.postgres.indexes.BrinIndex(autosummarize=True, fields=['taken_at'], name='devicevalue_taken_brin'),
+        ),
+    ]
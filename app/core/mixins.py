@@ -0,0 +1,132 @@
+"""
+Reusable mixins for the API views
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.http import parse_etags, quote_etag
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import permissions, status
+from rest_framework.response import Response
+
+from core.serializers import DynamicFieldsMixin
+
+SPARSE_FIELDS_PARAMS = ('fields', 'omit', 'expand')
+
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        name='fields',
+        description='Comma separated fields to include, dotted names '
+                    'select fields of nested objects (latest_value.value).',
+        required=False,
+        type=OpenApiTypes.STR,
+    ),
+    OpenApiParameter(
+        name='omit',
+        description='Comma separated fields to leave out.',
+        required=False,
+        type=OpenApiTypes.STR,
+    ),
+    OpenApiParameter(
+        name='expand',
+        description='Comma separated nested objects to render in full. '
+                    'When given, the others are collapsed to their id.',
+        required=False,
+        type=OpenApiTypes.STR,
+    ),
+]
+
+
+def etag_matches(request, etag):
+    """Return whether the client copy named by If-None-Match is current"""
+    # nginx weakens ETags of responses it gzips, so compare weakly
+    client_etags = [
+        tag.removeprefix('W/')
+        for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    ]
+    return etag in client_etags
+
+
+class ConditionalGetMixin:
+    """Add ETag / If-None-Match support to list and detail views.
+
+    The ETag is derived from a cheap aggregate over the queryset
+    (row count and ``updated_at`` watermark) so an unchanged resource is
+    answered with 304 before anything gets serialized.
+    """
+
+    def get_watermark(self, queryset):
+        """Return values that change whenever the queryset content does"""
+        return queryset.aggregate(
+            count=Count('pk'),
+            last_pk=Max('pk'),
+            updated=Max('updated_at'),
+        )
+
+    def get_etag(self, request, queryset):
+        """Build the ETag for the request from the queryset watermark"""
+        watermark = self.get_watermark(queryset)
+        key = '|'.join([
+            str(request.user.pk),
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+            repr(sorted(watermark.items())),
+        ])
+        return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
+    def conditional_response(self, request, queryset, view, *args, **kwargs):
+        """Return 304 when the client copy is current, else call view"""
+        etag = self.get_etag(request, queryset)
+        if etag_matches(request, etag):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED,
+                headers={'ETag': etag},
+            )
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(
+            request, queryset, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: kwargs[lookup_url_kwarg]}
+        )
+        return self.conditional_response(
+            request, queryset, super().retrieve, *args, **kwargs
+        )
+
+
+class SparseFieldsMixin:
+    """Pass ?fields=, ?omit= and ?expand= on to the serializer.
+
+    Only read requests are affected, so a sparse fieldset never changes
+    which fields a write accepts.
+    """
+
+    def get_sparse_fields(self):
+        """Return the sparse fieldset options of the request"""
+        if self.request.method not in permissions.SAFE_METHODS:
+            return {}
+        options = {}
+        for param in SPARSE_FIELDS_PARAMS:
+            if param in self.request.query_params:
+                value = self.request.query_params[param]
+                options[param] = [
+                    name.strip() for name in value.split(',') if name.strip()
+                ]
+        return options
+
+    def get_serializer(self, *args, **kwargs):
+        if issubclass(self.get_serializer_class(), DynamicFieldsMixin):
+            for option, value in self.get_sparse_fields().items():
+                kwargs.setdefault(option, value)
+        return super().get_serializer(*args, **kwargs)
@@ -1,6 +1,11 @@
+import hashlib
+import hmac
 import os
+import secrets
 import uuid
 
+from django.contrib.postgres.indexes import BrinIndex
+from django.core.validators import MaxValueValidator
 from django.db import models
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -83,6 +88,24 @@ class ToDoList(models.Model):
     related_file = models.FileField(null=True, upload_to=todo_file_path)
     is_completed = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at'],
+                name='todo_user_created_idx',
+            ),
+            models.Index(
+                fields=['user', 'is_completed', 'due_date'],
+                name='todo_user_done_due_idx',
+            ),
+            # Open todos by due date: overdue and "due today" lookups
+            models.Index(
+                fields=['user', 'due_date'],
+                name='todo_user_open_due_idx',
+                condition=models.Q(is_completed=False),
+            ),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.description}"
 
@@ -102,28 +125,230 @@ class IoTDevice(models.Model):
         return f"{self.device_name} - {self.device_purpose}"
 
 
+def api_key_digest(secret):
+    """Return the HMAC stored to verify the secret of a device key.
+
+    Keys are random, so unlike passwords they need no slow hash; the HMAC
+    keeps a leaked digest useless without SECRET_KEY.
+    """
+    return hmac.new(
+        settings.SECRET_KEY.encode(),
+        secret.encode(),
+        hashlib.sha256,
+    ).hexdigest()
+
+
+class DeviceAPIKeyManager(models.Manager):
+    """Manager for device API keys"""
+
+    def create_key(self, device, name=''):
+        """Create a key and return it with its plain text, shown once"""
+        prefix = secrets.token_hex(4)
+        while self.filter(prefix=prefix).exists():
+            prefix = secrets.token_hex(4)
+        secret = secrets.token_urlsafe(32)
+        api_key = self.create(
+            device=device,
+            name=name,
+            prefix=prefix,
+            digest=api_key_digest(secret),
+        )
+        return api_key, f'{prefix}.{secret}'
+
+
+class DeviceAPIKey(models.Model):
+    """Key a single device authenticates its readings with"""
+    device = models.ForeignKey(
+        'IoTDevice',
+        on_delete=models.CASCADE,
+        related_name='api_keys',
+    )
+    name = models.CharField(max_length=255, blank=True)
+    # Public part of the key, used to look it up
+    prefix = models.CharField(max_length=8, unique=True)
+    digest = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    objects = DeviceAPIKeyManager()
+
+    def __str__(self):
+        return f"{self.device} - {self.prefix}"
+
+    def revoke(self):
+        """Stop accepting the key"""
+        if self.revoked_at is None:
+            self.revoked_at = timezone.now()
+            self.save(update_fields=['revoked_at'])
+
+
 class DeviceValue(models.Model):
     """Value for IoT Device Model / Object"""
+    # Redundant with device.user and not needed for reads; new writers may
+    # leave it empty to save 8 bytes per row.
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        null=True,
+        blank=True,
     )
     device = models.ForeignKey(
         'IoTDevice',
         on_delete=models.CASCADE,
         related_name='values',
     )
-    value = models.IntegerField(default=0)  # Traffic Value ranged from 1 - 5
+    # Traffic Value ranged from 1 - 5
+    value = models.PositiveSmallIntegerField(
+        default=0,
+        validators=[MaxValueValidator(5)],
+    )
     # Each Vehicle Count
-    car_count = models.IntegerField(default=0)
-    motorcycle_count = models.IntegerField(default=0)
-    smalltruck_count = models.IntegerField(default=0)
-    bigvehicle_count = models.IntegerField(default=0)
-    # Date posted
-    taken_at = models.DateTimeField(auto_now_add=True)
+    car_count = models.PositiveSmallIntegerField(default=0)
+    motorcycle_count = models.PositiveSmallIntegerField(default=0)
+    smalltruck_count = models.PositiveSmallIntegerField(default=0)
+    bigvehicle_count = models.PositiveSmallIntegerField(default=0)
+    # Capture time sent by the device, or the arrival time without one
+    taken_at = models.DateTimeField(default=timezone.now)
     # Image File
     image = models.ImageField(null=True, upload_to=image_file_path)
+    # Chosen by the device so a retried reading is stored only once
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(value__lte=5),
+                name='devicevalue_value_range',
+            ),
+            models.UniqueConstraint(
+                fields=['device', 'idempotency_key'],
+                condition=models.Q(idempotency_key__isnull=False),
+                name='devicevalue_idempotency_key',
+            ),
+        ]
+        indexes = [
+            # Latest value and value lists of a device by capture time
+            models.Index(
+                fields=['device', '-taken_at'],
+                name='devicevalue_device_taken_idx',
+            ),
+            # Recent values of all devices, read by the rollup refresh.
+            # Values arrive roughly in capture order, so a BRIN index stays
+            # tiny and cheap to maintain. Filled page ranges are summarized
+            # right away, not at the next vacuum, or the newest ones would
+            # match every query.
+            BrinIndex(
+                fields=['taken_at'],
+                name='devicevalue_taken_brin',
+                autosummarize=True,
+            ),
+            # Owner check of protected media downloads, few rows have one
+            models.Index(
+                fields=['image'],
+                name='devicevalue_image_idx',
+                condition=~models.Q(image=''),
+            ),
+        ]
 
     def __str__(self):
         return (f"Device : {self.device} at {self.taken_at} . Value = {self.value} "  # NOQA
                 f"[{self.motorcycle_count, self.car_count, self.smalltruck_count, self.bigvehicle_count}]")  # NOQA
+
+
+class DeviceTrafficHourly(models.Model):
+    """Hourly traffic rollup of DeviceValue, read by Grafana dashboards"""
+    device = models.ForeignKey(
+        'IoTDevice',
+        on_delete=models.CASCADE,
+        related_name='hourly_traffic',
+    )
+    bucket = models.DateTimeField()
+    samples = models.IntegerField(default=0)
+    # Congestion over the hour
+    avg_value = models.FloatField(default=0)
+    max_value = models.IntegerField(default=0)
+    # Vehicle class mix over the hour
+    car_count = models.IntegerField(default=0)
+    motorcycle_count = models.IntegerField(default=0)
+    smalltruck_count = models.IntegerField(default=0)
+    bigvehicle_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device', 'bucket'],
+                name='unique_device_traffic_hour',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Device : {self.device_id} at {self.bucket} . Avg = {self.avg_value}"  # NOQA
+
+
+class DeviceTrafficDirtyHour(models.Model):
+    """Hour of a device that got late values since it was rolled up"""
+    device = models.ForeignKey('IoTDevice', on_delete=models.CASCADE)
+    bucket = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device', 'bucket'],
+                name='unique_device_dirty_hour',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Device : {self.device_id} at {self.bucket}"
+
+
+class Job(models.Model):
+    """Deferred work, run by the worker (manage.py run_jobs)"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    state = models.CharField(max_length=16, choices=STATES, default=QUEUED)
+    # Only one queued or running job may have the same key
+    key = models.CharField(max_length=255, null=True, blank=True)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Claiming the next due job
+            models.Index(
+                fields=['run_at', 'id'],
+                condition=models.Q(state='queued'),
+                name='job_queued_run_at_idx',
+            ),
+            models.Index(
+                fields=['name'],
+                condition=models.Q(state='running'),
+                name='job_running_name_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=models.Q(state__in=['queued', 'running']),
+                name='job_active_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Job {self.name} ({self.state}) at {self.run_at}"
@@ -0,0 +1,167 @@
+"""
+Hourly traffic rollups backing the Grafana dashboards.
+
+Rollups are upserted per (device, hour), so refreshing never locks or
+empties the table Grafana is reading. An incremental refresh recomputes
+the previous and the current hour by the clock (and any hour after the
+last one it stored, to catch up after a pause), plus the older hours that
+late (backfilled) or deleted values were in.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from core.models import (
+    DeviceValue,
+    DeviceTrafficDirtyHour,
+    DeviceTrafficHourly,
+)
+
+BATCH_SIZE = 1000
+
+ROLLUP_FIELDS = [
+    'samples',
+    'avg_value',
+    'max_value',
+    'car_count',
+    'motorcycle_count',
+    'smalltruck_count',
+    'bigvehicle_count',
+]
+
+
+def hourly_rows(values):
+    """Aggregate a DeviceValue queryset into per device, per hour rows"""
+    return (
+        values
+        .annotate(bucket=TruncHour('taken_at'))
+        .values('device', 'bucket')
+        .annotate(
+            samples=Count('id'),
+            avg_value=Avg('value'),
+            max_value=Max('value'),
+            car_count=Sum('car_count'),
+            motorcycle_count=Sum('motorcycle_count'),
+            smalltruck_count=Sum('smalltruck_count'),
+            bigvehicle_count=Sum('bigvehicle_count'),
+        )
+        .order_by()
+    )
+
+
+def save_rollups(rollups):
+    """Insert or update rollup rows on their (device, bucket) key"""
+    DeviceTrafficHourly.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=['device', 'bucket'],
+        update_fields=ROLLUP_FIELDS,
+    )
+
+
+def truncate_hour(moment):
+    """Return the start of the hour a moment falls in, like TruncHour"""
+    return timezone.localtime(moment).replace(
+        minute=0,
+        second=0,
+        microsecond=0,
+    )
+
+
+def mark_dirty(values):
+    """Mark the past hours that values were written into or removed from.
+
+    Values of the current hour are covered by the next incremental refresh
+    anyway, so only late values cost a (single) extra query.
+    """
+    current = truncate_hour(timezone.now())
+    dirty = {
+        (value.device_id, truncate_hour(value.taken_at))
+        for value in values
+    }
+    DeviceTrafficDirtyHour.objects.bulk_create(
+        [
+            DeviceTrafficDirtyHour(device_id=device_id, bucket=bucket)
+            for device_id, bucket in dirty
+            if bucket < current
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def refresh_hourly(full=False):
+    """Refresh hourly rollups and return how many rows were written"""
+    with transaction.atomic():
+        # Claimed before aggregating, so values marked while this runs
+        # leave a new mark for the next refresh.
+        dirty = list(DeviceTrafficDirtyHour.objects.select_for_update())
+        DeviceTrafficDirtyHour.objects.filter(
+            pk__in=[hour.pk for hour in dirty],
+        ).delete()
+        return refresh_values(full, dirty)
+
+
+def refresh_start():
+    """Return the first hour an incremental refresh recomputes.
+
+    Values of the current hour are not marked dirty, so every hour that
+    was current since the last refresh is recomputed. That is the hour
+    before the newest stored one, which may be an hour ahead of the
+    refresh that stored it (INGEST_MAX_CLOCK_SKEW is below an hour), and
+    never later than the previous hour by the clock.
+    """
+    current = truncate_hour(timezone.now())
+    last = DeviceTrafficHourly.objects.aggregate(last=Max('bucket'))['last']
+    if last is None:
+        return None
+    return min(last, current) - timedelta(hours=1)
+
+
+def refresh_values(full, dirty):
+    """Upsert the rollups of the newest hours and the dirty ones"""
+    values = DeviceValue.objects.all()
+    rollup_rows = DeviceTrafficHourly.objects.all()
+    start = None if full else refresh_start()
+    if start is not None:
+        # devicevalue_taken_brin finds the newest hours, and
+        # devicevalue_device_taken_idx each dirty one
+        windows = Q(taken_at__gte=start)
+        buckets = Q(bucket__gte=start)
+        for hour in dirty:
+            windows |= Q(
+                device=hour.device_id,
+                taken_at__gte=hour.bucket,
+                taken_at__lt=hour.bucket + timedelta(hours=1),
+            )
+            buckets |= Q(device=hour.device_id, bucket=hour.bucket)
+        values = values.filter(windows)
+        rollup_rows = rollup_rows.filter(buckets)
+
+    written = set()
+    rollups = []
+    for row in hourly_rows(values).iterator(chunk_size=BATCH_SIZE):
+        rollups.append(DeviceTrafficHourly(
+            device_id=row.pop('device'),
+            **row,
+        ))
+        if len(rollups) >= BATCH_SIZE:
+            save_rollups(rollups)
+            written.update((r.device_id, r.bucket) for r in rollups)
+            rollups = []
+    if rollups:
+        save_rollups(rollups)
+        written.update((r.device_id, r.bucket) for r in rollups)
+
+    # Hours whose values were all deleted have nothing left to roll up
+    emptied = [
+        pk
+        for pk, device_id, bucket in rollup_rows.values_list(
+            'pk', 'device_id', 'bucket',
+        ).iterator(chunk_size=BATCH_SIZE)
+        if (device_id, bucket) not in written
+    ]
+    DeviceTrafficHourly.objects.filter(pk__in=emptied).delete()
+    return len(written)
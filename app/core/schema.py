@@ -0,0 +1,129 @@
+"""
+Precomputed OpenAPI schema.
+
+Generating the schema introspects every view and serializer, so it is done
+once per code version by the ``generate_schema`` command and kept in
+SCHEMA_CACHE_DIR. Workers load that file, keep the rendered documents in
+memory and answer pollers with an ETag.
+"""
+import contextlib
+import functools
+import glob
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import drf_spectacular
+import rest_framework
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+from core.mixins import etag_matches
+
+_cache = {}
+
+
+@functools.cache
+def code_version():
+    """Return APP_VERSION, or a hash of the source and schema libraries"""
+    if settings.APP_VERSION:
+        return settings.APP_VERSION
+
+    digest = hashlib.sha256()
+    digest.update(drf_spectacular.__version__.encode())
+    digest.update(rest_framework.VERSION.encode())
+    base_dir = Path(settings.BASE_DIR)
+    for path in sorted(base_dir.rglob('*.py')):
+        digest.update(path.relative_to(base_dir).as_posix().encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def schema_path(version=None):
+    """Return the file the schema of a code version is stored in"""
+    return os.path.join(
+        settings.SCHEMA_CACHE_DIR,
+        f'openapi-{version or code_version()}.json',
+    )
+
+
+def generate_schema():
+    """Generate the schema, write it to disk and return it"""
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    path = schema_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Write then rename, so other workers never read a partial file
+    partial = f'{path}.{os.getpid()}.tmp'
+    with open(partial, 'w') as schema_file:
+        json.dump(schema, schema_file)
+    os.replace(partial, path)
+
+    for stale in glob.glob(schema_path('*')):
+        if stale != path:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(stale)
+    return schema
+
+
+def get_schema():
+    """Return the schema of the running code version"""
+    version = code_version()
+    if _cache.get('version') != version:
+        try:
+            with open(schema_path(version)) as schema_file:
+                schema = json.load(schema_file)
+        except (OSError, ValueError):
+            schema = generate_schema()
+        _cache.clear()
+        _cache.update(version=version, schema=schema, rendered={})
+    return _cache['schema']
+
+
+def render_schema(renderer, media_type):
+    """Return the schema rendered for a media type, cached in memory"""
+    schema = get_schema()
+    rendered = _cache['rendered']
+    if media_type not in rendered:
+        rendered[media_type] = renderer.render(
+            schema,
+            media_type,
+            renderer_context={},
+        )
+    return rendered[media_type]
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """Serve the precomputed schema instead of generating it per request"""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        media_type = request.accepted_media_type
+        # YAML and JSON are different representations of the version
+        etag = quote_etag('{}-{}'.format(
+            code_version(),
+            hashlib.sha1(media_type.encode()).hexdigest()[:8],
+        ))
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            patch_vary_headers(response, ['Accept'])
+            return response
+
+        response = HttpResponse(
+            render_schema(renderer, media_type),
+            content_type=media_type,
+        )
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept'])
+        response['Content-Disposition'] = (
+            f'inline; filename="schema.{renderer.format}"'
+        )
+        return response
@@ -0,0 +1,82 @@
+"""
+Reusable serializer building blocks
+"""
+from rest_framework import serializers
+
+
+def split_names(names, keep_parents):
+    """Split dotted names into own names and names per nested field"""
+    own, nested = set(), {}
+    for name in names:
+        parent, _, child = name.partition('.')
+        if not child:
+            own.add(parent)
+            continue
+        nested.setdefault(parent, []).append(child)
+        if keep_parents:
+            own.add(parent)
+    return own, nested
+
+
+class DynamicFieldsMixin:
+    """Serializer mixin rendering only the fields a client asks for.
+
+    ``fields`` keeps and ``omit`` drops field names; dotted names such as
+    ``latest_value.value`` reach into nested serializers. Fields listed in
+    ``Meta.expandable_fields`` are rendered in full by default; once an
+    ``expand`` list is given, the ones it does not name are collapsed to
+    their primary key, or left out when they are not a relation.
+    Fields that are left out are never evaluated, so neither are their
+    queries.
+    """
+
+    def __init__(self, *args, fields=None, omit=None, expand=None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse = {'fields': fields, 'omit': omit, 'expand': expand}
+        self.nested_sparse = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        nested = {}
+
+        if self.sparse['fields'] is not None:
+            keep, nested['fields'] = split_names(self.sparse['fields'], True)
+            fields = {
+                name: field for name, field in fields.items()
+                if name in keep
+            }
+
+        if self.sparse['omit'] is not None:
+            drop, nested['omit'] = split_names(self.sparse['omit'], False)
+            for name in drop:
+                fields.pop(name, None)
+
+        if self.sparse['expand'] is not None:
+            expand, nested['expand'] = split_names(
+                self.sparse['expand'],
+                True,
+            )
+            for name in getattr(self.Meta, 'expandable_fields', []):
+                if name not in fields or name in expand:
+                    continue
+                if isinstance(fields[name], serializers.BaseSerializer):
+                    fields[name] = serializers.PrimaryKeyRelatedField(
+                        read_only=True,
+                    )
+                else:
+                    del fields[name]
+
+        self.nested_sparse = {}
+        for option, names_by_field in nested.items():
+            for name, names in names_by_field.items():
+                self.nested_sparse.setdefault(name, {})[option] = names
+        for name, options in self.nested_sparse.items():
+            field = fields.get(name)
+            if isinstance(field, DynamicFieldsMixin):
+                field.sparse.update(options)
+        return fields
+
+    def get_nested_sparse(self, name):
+        """Return the sparse options given for a nested field"""
+        return self.nested_sparse.get(name, {})
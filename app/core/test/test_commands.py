@@ -1,35 +1,86 @@
 """
 Test for the managements commands for curious API
 """
+import itertools
+import tempfile
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2Error
 
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, override_settings
 
+from core.health import database_available
 
-@patch('core.management.commands.wait_for_db.Command.check')
+
+@patch('core.management.commands.wait_for_db.database_available')
 class CommandTests(SimpleTestCase):
     """Test commands."""
 
-    @staticmethod
-    def test_wait_for_db_ready(self, patched_check):
+    def test_wait_for_db_ready(self, patched_available):
         """Test waiting for db ready."""
-        patched_check.return_value = True
+        patched_available.return_value = True
 
         call_command('wait_for_db')
 
-        patched_check.assert_called_once_with(databases=['default'])
+        patched_available.assert_called_once_with('default')
 
     @patch('time.sleep')
-    def test_wait_for_db_delay(self, patched_sleep, patched_check):
-        """Test waiting for db when getting Operational Error"""
-        patched_check.side_effect = [Psycopg2Error] * 2 + \
-                                    [OperationalError] * 3 + [True]
+    def test_wait_for_db_delay(self, patched_sleep, patched_available):
+        """Test waiting for db backs off until it is available"""
+        patched_available.side_effect = [False] * 5 + [True]
 
-        call_command('wait_for_db')
+        call_command('wait_for_db', '--base-delay', '1', '--max-delay', '4')
+
+        self.assertEqual(patched_available.call_count, 6)
+        delays = [call.args[0] for call in patched_sleep.call_args_list]
+        self.assertEqual(len(delays), 5)
+        for delay, limit in zip(delays, [1, 2, 4, 4, 4]):
+            self.assertGreaterEqual(delay, limit / 2)
+            self.assertLessEqual(delay, limit)
+
+    @patch('time.sleep')
+    @patch('time.monotonic', side_effect=itertools.count(0, 10))
+    def test_wait_for_db_timeout(self, patched_monotonic, patched_sleep,
+                                 patched_available):
+        """Test waiting for db gives up after the deadline"""
+        patched_available.return_value = False
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', '--timeout', '25')
+
+        self.assertEqual(patched_available.call_count, 3)
+
+
+class DatabaseProbeTests(SimpleTestCase):
+    """Test the database connectivity probe."""
+
+    @patch('core.health.connections')
+    def test_database_unavailable(self, patched_connections):
+        """Test the probe reports a failing connection as unavailable"""
+        connection = patched_connections.__getitem__.return_value
+        connection.cursor.side_effect = [Psycopg2Error, OperationalError]
+
+        self.assertFalse(database_available())
+        self.assertFalse(database_available())
+        connection.close.assert_called_with()
+
+
+@patch('core.management.commands.collectstatic_if_changed.call_command')
+class CollectStaticTests(SimpleTestCase):
+    """Test collecting static files only when they changed."""
+
+    def test_collectstatic_skipped_when_current(self, patched_collect):
+        """Test collectstatic runs once for unchanged static files"""
+        with tempfile.TemporaryDirectory() as static_root:
+            with override_settings(STATIC_ROOT=static_root):
+                call_command('collectstatic_if_changed')
+                call_command('collectstatic_if_changed')
 
-        self.assertEqual(patched_check.call_count, 6)
-        patched_check.assert_called_with(databases=['default'])
+        patched_collect.assert_called_once_with(
+            'collectstatic',
+            interactive=False,
+            verbosity=0,
+        )
@@ -0,0 +1,90 @@
+"""
+Test for the primary/replica database router
+"""
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core import db_routing
+from core.models import DeviceValue, User
+
+
+def route_read(model):
+    """Return a view reporting where a read of model would be routed"""
+    def view(request):
+        router = db_routing.PrimaryReplicaRouter()
+        return HttpResponse(router.db_for_read(model))
+    return view
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'curious-test-cache'),
+    },
+})
+class DatabaseRoutingTests(SimpleTestCase):
+    """Test routing reads between the primary and the replica"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        cache.clear()
+
+    def test_safe_request_reads_from_replica(self):
+        """Test that data reads of a GET request use the replica"""
+        middleware = db_routing.ReplicaRoutingMiddleware(
+            route_read(DeviceValue)
+        )
+        res = middleware(self.factory.get('/'))
+
+        self.assertEqual(res.content, b'replica')
+
+    def test_auth_models_read_from_primary(self):
+        """Test that users are always read from the primary"""
+        middleware = db_routing.ReplicaRoutingMiddleware(route_read(User))
+        res = middleware(self.factory.get('/'))
+
+        self.assertEqual(res.content, b'default')
+
+    def test_unsafe_request_reads_from_primary(self):
+        """Test that reads during a write request use the primary"""
+        middleware = db_routing.ReplicaRoutingMiddleware(
+            route_read(DeviceValue)
+        )
+        res = middleware(self.factory.post('/'))
+
+        self.assertEqual(res.content, b'default')
+
+    def test_reads_after_write_pinned_to_primary(self):
+        """Test that a client reads its own writes after posting"""
+        middleware = db_routing.ReplicaRoutingMiddleware(
+            route_read(DeviceValue)
+        )
+        middleware(self.factory.post('/', HTTP_AUTHORIZATION='Token abc'))
+
+        res = middleware(self.factory.get('/', HTTP_AUTHORIZATION='Token abc'))
+        self.assertEqual(res.content, b'default')
+
+        res = middleware(self.factory.get('/', HTTP_AUTHORIZATION='Token xyz'))
+        self.assertEqual(res.content, b'replica')
+
+    def test_reads_outside_request_use_primary(self):
+        """Test that commands and shells read from the primary"""
+        router = db_routing.PrimaryReplicaRouter()
+
+        self.assertEqual(router.db_for_read(DeviceValue), 'default')
+        self.assertEqual(router.db_for_write(DeviceValue), 'default')
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    })
+    def test_process_local_cache_refused(self):
+        """Test routing is not enabled with pins other workers cannot see"""
+        with self.assertRaises(ImproperlyConfigured):
+            db_routing.ReplicaRoutingMiddleware(route_read(DeviceValue))
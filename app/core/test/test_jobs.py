@@ -0,0 +1,206 @@
+"""
+Tests for the database backed job queue
+"""
+import os
+import signal
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+
+@override_settings(JOB_RETRY_DELAY=10, JOB_RETRY_MAX_DELAY=60)
+class JobQueueTests(TestCase):
+    """Test queueing, claiming and running jobs"""
+
+    def setUp(self):
+        patcher = patch.dict(jobs.registry, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+        @jobs.job(max_attempts=3)
+        def record(**payload):
+            self.calls.append(payload)
+
+        @jobs.job(max_attempts=2)
+        def explode():
+            raise RuntimeError('boom')
+
+        @jobs.job(concurrency=1)
+        def single():
+            pass
+
+        @jobs.job(every=timedelta(minutes=5))
+        def tick():
+            self.calls.append('tick')
+
+    def test_run_job(self):
+        """Test a queued job runs once with its payload"""
+        jobs.enqueue('record', {'device': 1})
+
+        claimed = jobs.work()
+
+        self.assertEqual(self.calls, [{'device': 1}])
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.state, Job.DONE)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNone(jobs.work())
+
+    def test_future_jobs_wait(self):
+        """Test jobs are not claimed before run_at"""
+        jobs.enqueue('record', run_at=timezone.now() + timedelta(hours=1))
+
+        self.assertIsNone(jobs.work())
+        self.assertEqual(self.calls, [])
+
+    def test_retry_with_backoff(self):
+        """Test failed jobs are retried later, then marked failed"""
+        jobs.enqueue('explode')
+
+        claimed = jobs.work()
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.state, Job.QUEUED)
+        self.assertIn('boom', claimed.last_error)
+        self.assertAlmostEqual(
+            (claimed.run_at - timezone.now()).total_seconds(),
+            10,
+            delta=2,
+        )
+        self.assertEqual(jobs.backoff(2), timedelta(seconds=20))
+        self.assertEqual(jobs.backoff(10), timedelta(seconds=60))
+
+        Job.objects.update(run_at=timezone.now())
+        jobs.work()
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.state, Job.FAILED)
+        self.assertEqual(claimed.attempts, 2)
+
+    def test_concurrency_limit(self):
+        """Test a job type at its limit does not hold up other types"""
+        Job.objects.create(name='single', state=Job.RUNNING)
+        jobs.enqueue('single')
+        jobs.enqueue('record')
+
+        claimed = jobs.work()
+
+        self.assertEqual(claimed.name, 'record')
+        self.assertIsNone(jobs.work())
+
+    def test_periodic_job(self):
+        """Test a periodic job queues its next run once it finished"""
+        jobs.schedule_periodic()
+        jobs.schedule_periodic()
+        self.assertEqual(Job.objects.filter(state=Job.QUEUED).count(), 1)
+
+        jobs.work()
+
+        self.assertEqual(self.calls, ['tick'])
+        following = Job.objects.get(state=Job.QUEUED)
+        self.assertEqual(following.key, 'periodic:tick')
+        self.assertGreater(following.run_at, timezone.now())
+
+    def test_unique_key(self):
+        """Test a job with the key of a pending one is not queued"""
+        jobs.enqueue('record', key='device-1')
+        jobs.enqueue('record', key='device-1')
+        self.assertEqual(Job.objects.count(), 1)
+
+        jobs.work()
+        jobs.enqueue('record', key='device-1')
+        self.assertEqual(Job.objects.count(), 2)
+
+    @override_settings(JOB_TIMEOUT=60)
+    def test_requeue_stale(self):
+        """Test jobs of a worker that died are run again"""
+        lost = Job.objects.create(
+            name='record',
+            state=Job.RUNNING,
+            attempts=1,
+            max_attempts=3,
+            locked_at=timezone.now() - timedelta(minutes=5),
+        )
+
+        jobs.requeue_stale()
+
+        lost.refresh_from_db()
+        self.assertEqual(lost.state, Job.QUEUED)
+        self.assertIsNone(lost.locked_at)
+
+    @override_settings(JOB_TIMEOUT=60)
+    def test_lost_claim_not_overwritten(self):
+        """Test a worker whose job was requeued does not store its outcome"""
+        jobs.enqueue('record')
+        claimed = jobs.claim()
+        Job.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        jobs.requeue_stale()
+
+        jobs.run(claimed)
+
+        requeued = Job.objects.get()
+        self.assertEqual(requeued.state, Job.QUEUED)
+        self.assertIn('claim', requeued.last_error)
+
+    def test_unknown_job_fails(self):
+        """Test jobs without a registered type fail right away"""
+        jobs.enqueue('missing')
+
+        claimed = jobs.work()
+
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.state, Job.FAILED)
+
+    def test_run_jobs_command(self):
+        """Test the worker runs due jobs and exits with --once"""
+        jobs.enqueue('record', {'device': 2})
+
+        call_command('run_jobs', '--once', stdout=open('/dev/null', 'w'))
+
+        self.assertIn({'device': 2}, self.calls)
+        self.assertIn('tick', self.calls)
+
+    def test_run_jobs_stops_on_sigterm(self):
+        """Test the worker finishes its job and exits on SIGTERM"""
+        @jobs.job()
+        def deploy():
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        Job.objects.all().delete()
+        jobs.enqueue('deploy')
+        jobs.enqueue('record', run_at=timezone.now() + timedelta(seconds=1))
+
+        # Without --once the worker only returns once it was stopped
+        call_command('run_jobs', stdout=open('/dev/null', 'w'))
+
+        self.assertEqual(Job.objects.get(name='deploy').state, Job.DONE)
+        self.assertEqual(Job.objects.get(name='record').state, Job.QUEUED)
+
+
+@override_settings(JOB_HEARTBEAT_INTERVAL=0.05)
+class JobHeartbeatTests(TransactionTestCase):
+    """Test running jobs keep their claim fresh"""
+
+    def test_heartbeat_refreshes_claim(self):
+        """Test the claim of a long running job is refreshed"""
+        with patch.dict(jobs.registry, clear=True):
+            @jobs.job()
+            def slow():
+                time.sleep(0.3)
+
+            jobs.enqueue('slow')
+            claimed = jobs.claim()
+            claimed_at = claimed.locked_at
+            heartbeat = jobs.Heartbeat(claimed)
+            heartbeat.start()
+            time.sleep(0.3)
+            heartbeat.stop()
+
+        refreshed = Job.objects.get()
+        self.assertGreater(refreshed.locked_at, claimed_at)
+        self.assertEqual(refreshed.locked_at, claimed.locked_at)
@@ -1,5 +1,6 @@
 from functools import wraps
 
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from unittest.mock import patch
@@ -82,7 +83,7 @@ class ModelTests(TestCase):
         value1 = models.DeviceValue.objects.create(
             user=device.user,
             device=device,
-            value=9,
+            value=4,
             motorcycle_count=2,
             car_count=3,
             smalltruck_count=4,
@@ -94,6 +95,21 @@ class ModelTests(TestCase):
             f"[{value1.motorcycle_count, value1.car_count, value1.smalltruck_count, value1.bigvehicle_count}]"  # NOQA
         )
 
+    def test_value_out_of_range(self):
+        """Test the database rejects traffic values above 5"""
+        device = create_device()
+
+        with self.assertRaises(IntegrityError):
+            models.DeviceValue.objects.create(device=device, value=6)
+
+    def test_create_value_without_user(self):
+        """Test values can be stored without the redundant user"""
+        device = create_device()
+        value = models.DeviceValue.objects.create(device=device, value=1)
+
+        self.assertIsNone(value.user)
+        self.assertEqual(value.device.user, device.user)
+
     @patch('uuid.uuid4')
     def test_image_name_path(self, mock_uuid):
         """Test generating image path"""
@@ -0,0 +1,138 @@
+"""
+Test for the hourly traffic rollups
+"""
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core import rollups
+from core.models import (
+    IoTDevice,
+    DeviceValue,
+    DeviceTrafficDirtyHour,
+    DeviceTrafficHourly,
+)
+
+
+class TrafficRollupTests(TestCase):
+    """Test refreshing DeviceTrafficHourly"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='example@rayhank.com',
+            password='changeme',
+        )
+        self.device = IoTDevice.objects.create(
+            user=self.user,
+            device_name='ESP32',
+        )
+
+    def create_value(self, value, **params):
+        """Create a value for the sample device"""
+        return DeviceValue.objects.create(
+            user=self.user,
+            device=self.device,
+            value=value,
+            **params,
+        )
+
+    def test_refresh_rollups(self):
+        """Test that values are rolled up per device and hour"""
+        self.create_value(1, car_count=2, motorcycle_count=5)
+        self.create_value(3, car_count=4, motorcycle_count=1)
+
+        call_command('refresh_traffic_rollups')
+
+        rollup = DeviceTrafficHourly.objects.get(device=self.device)
+        self.assertEqual(rollup.samples, 2)
+        self.assertEqual(rollup.avg_value, 2)
+        self.assertEqual(rollup.max_value, 3)
+        self.assertEqual(rollup.car_count, 6)
+        self.assertEqual(rollup.motorcycle_count, 6)
+
+    def test_refresh_rollups_incremental(self):
+        """Test that a refresh updates the newest hour in place"""
+        self.create_value(1)
+        call_command('refresh_traffic_rollups')
+        self.create_value(5)
+
+        call_command('refresh_traffic_rollups')
+
+        rollup = DeviceTrafficHourly.objects.get(device=self.device)
+        self.assertEqual(rollup.samples, 2)
+        self.assertEqual(rollup.max_value, 5)
+
+    def test_late_value_marks_hour_dirty(self):
+        """Test only values for past hours mark their hour dirty"""
+        late = self.create_value(1, taken_at=timezone.now() - timedelta(
+            hours=3,
+        ))
+        current = self.create_value(2)
+
+        rollups.mark_dirty([late, current])
+
+        dirty = DeviceTrafficDirtyHour.objects.get()
+        self.assertEqual(dirty.device, self.device)
+        self.assertEqual(dirty.bucket, rollups.truncate_hour(late.taken_at))
+
+    def test_refresh_rollups_late_value(self):
+        """Test an incremental refresh recomputes the dirty hour only"""
+        now = timezone.now()
+        self.create_value(1, taken_at=now - timedelta(hours=3))
+        self.create_value(2, taken_at=now - timedelta(hours=5))
+        self.create_value(3, taken_at=now)
+        call_command('refresh_traffic_rollups')
+        # Change an hour behind the refresh's back, it stays as it was
+        DeviceValue.objects.filter(value=2).update(car_count=9)
+
+        late = self.create_value(5, taken_at=now - timedelta(hours=3))
+        rollups.mark_dirty([late])
+        call_command('refresh_traffic_rollups')
+
+        hourly = {
+            rollup.bucket: rollup
+            for rollup in DeviceTrafficHourly.objects.all()
+        }
+        late_hour = hourly[rollups.truncate_hour(late.taken_at)]
+        self.assertEqual(late_hour.samples, 2)
+        self.assertEqual(late_hour.max_value, 5)
+        untouched = hourly[rollups.truncate_hour(now - timedelta(hours=5))]
+        self.assertEqual(untouched.car_count, 0)
+        self.assertFalse(DeviceTrafficDirtyHour.objects.exists())
+
+    def test_future_hour_does_not_skip_current_hour(self):
+        """Test a reading ahead of the clock does not hide this hour"""
+        other_device = IoTDevice.objects.create(
+            user=self.user,
+            device_name='Other',
+        )
+        # Stored by a refresh just before the hour ended
+        self.create_value(1, taken_at=timezone.now() + timedelta(hours=1))
+        call_command('refresh_traffic_rollups')
+
+        DeviceValue.objects.create(device=other_device, value=4)
+        call_command('refresh_traffic_rollups')
+
+        rollup = DeviceTrafficHourly.objects.get(device=other_device)
+        self.assertEqual(rollup.max_value, 4)
+
+    def test_refresh_rollups_deleted_values(self):
+        """Test hours whose values were deleted are rolled up again"""
+        now = timezone.now()
+        kept = self.create_value(1, taken_at=now - timedelta(hours=3))
+        removed = self.create_value(5, taken_at=now - timedelta(hours=3))
+        emptied = self.create_value(2, taken_at=now - timedelta(hours=5))
+        call_command('refresh_traffic_rollups')
+
+        for value in (removed, emptied):
+            value.delete()
+        rollups.mark_dirty([removed, emptied])
+        call_command('refresh_traffic_rollups')
+
+        rollup = DeviceTrafficHourly.objects.get()
+        self.assertEqual(rollup.bucket, rollups.truncate_hour(kept.taken_at))
+        self.assertEqual(rollup.samples, 1)
+        self.assertEqual(rollup.max_value, 1)
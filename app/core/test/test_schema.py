@@ -0,0 +1,90 @@
+"""
+Tests for the precomputed OpenAPI schema
+"""
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from core import schema
+
+SCHEMA_URL = reverse('schema')
+
+
+class CachedSchemaTests(SimpleTestCase):
+    """Test the schema is generated once per code version"""
+
+    def setUp(self):
+        self.schema_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.schema_dir.cleanup)
+        settings_override = override_settings(
+            SCHEMA_CACHE_DIR=self.schema_dir.name,
+            APP_VERSION='v1',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        schema.code_version.cache_clear()
+        self.addCleanup(schema.code_version.cache_clear)
+        schema._cache.clear()
+
+    def test_generate_schema_command(self):
+        """Test the command writes the schema of the code version once"""
+        call_command('generate_schema')
+        self.assertTrue(os.path.exists(schema.schema_path('v1')))
+
+        with patch('core.schema.generate_schema') as patched_generate:
+            call_command('generate_schema')
+        patched_generate.assert_not_called()
+
+    def test_new_version_replaces_old_schema(self):
+        """Test generating a new version removes the stale file"""
+        call_command('generate_schema')
+        with override_settings(APP_VERSION='v2'):
+            schema.code_version.cache_clear()
+            call_command('generate_schema')
+
+        self.assertEqual(
+            os.listdir(self.schema_dir.name),
+            ['openapi-v2.json'],
+        )
+
+    def test_schema_served_from_cache(self):
+        """Test requests do not generate the schema again"""
+        call_command('generate_schema')
+
+        with patch('core.schema.SchemaGenerator') as patched_generator:
+            res = self.client.get(SCHEMA_URL, {'format': 'json'})
+            self.client.get(SCHEMA_URL)
+        patched_generator.assert_not_called()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['ETag'].startswith('"v1-'))
+        self.assertIn('/api/user/todo/', res.json()['paths'])
+
+    def test_schema_not_modified(self):
+        """Test pollers sending the ETag get 304, also once gzipped"""
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], etag)
+
+        # As weakened by nginx when it compressed the response
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=f'W/{etag}')
+        self.assertEqual(res.status_code, 304)
+
+    def test_schema_etag_per_media_type(self):
+        """Test the YAML ETag does not revalidate the JSON document"""
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        res = self.client.get(
+            SCHEMA_URL,
+            {'format': 'json'},
+            HTTP_IF_NONE_MATCH=etag,
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
@@ -0,0 +1,71 @@
+"""
+Tests for the token bucket throttling
+"""
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from core import throttling
+
+
+class TokenBucketTests(SimpleTestCase):
+    """Test taking tokens from shared buckets"""
+
+    def setUp(self):
+        patcher = patch.object(
+            throttling,
+            'buckets',
+            throttling.LocalBuckets(),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_up_to_capacity(self):
+        """Test a full bucket allows a burst, then reports the wait"""
+        for _ in range(3):
+            self.assertEqual(throttling.take('key', 1, 3, now=100), 0)
+
+        self.assertAlmostEqual(throttling.take('key', 1, 3, now=100), 1)
+        self.assertAlmostEqual(throttling.take('key', 1, 3, now=100.25), 0.75)
+
+    def test_refill(self):
+        """Test tokens come back at the rate, up to the capacity"""
+        for _ in range(3):
+            throttling.take('key', 2, 3, now=100)
+
+        self.assertEqual(throttling.take('key', 2, 3, now=100.5), 0)
+        self.assertGreater(throttling.take('key', 2, 3, now=100.5), 0)
+
+        for _ in range(3):
+            self.assertEqual(throttling.take('key', 2, 3, now=200), 0)
+        self.assertGreater(throttling.take('key', 2, 3, now=200), 0)
+
+    def test_cost(self):
+        """Test requests may take several tokens, and go into debt"""
+        self.assertEqual(throttling.take('key', 1, 3, now=100, cost=2), 0)
+        self.assertAlmostEqual(
+            throttling.take('key', 1, 3, now=100, cost=2),
+            1,
+        )
+
+        # A full bucket admits a cost above its capacity, then refills it
+        self.assertEqual(throttling.take('big', 1, 3, now=100, cost=5), 0)
+        self.assertAlmostEqual(throttling.take('big', 1, 3, now=100), 3)
+        self.assertEqual(throttling.take('big', 1, 3, now=103), 0)
+
+    def test_keys_are_separate(self):
+        """Test an empty bucket does not limit other keys"""
+        throttling.take('a', 1, 1, now=100)
+
+        self.assertGreater(throttling.take('a', 1, 1, now=100), 0)
+        self.assertEqual(throttling.take('b', 1, 1, now=100), 0)
+
+    def test_idle_buckets_dropped(self):
+        """Test the local store drops refilled buckets when it is full"""
+        store = throttling.buckets
+        with patch.object(throttling.LocalBuckets, 'MAX_BUCKETS', 2):
+            throttling.take('a', 1, 1, now=100)
+            throttling.take('b', 1, 1, now=100)
+            throttling.take('c', 1, 1, now=200)
+
+        self.assertEqual(list(store.buckets), ['c'])
@@ -0,0 +1,94 @@
+"""
+Tests for resumable uploads
+"""
+import fcntl
+import io
+import os
+import tempfile
+import threading
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from core import uploads
+
+
+class ResumableUploadTests(SimpleTestCase):
+    """Test locking and expiry of resumable uploads"""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        settings = override_settings(FILE_UPLOAD_TEMP_DIR=temp_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_appends_at_same_offset_serialized(self):
+        """Test only one of two chunks sent at the same offset is kept"""
+        upload = uploads.ResumableUpload('value-1', 'image')
+        errors = []
+
+        def append_again():
+            with upload.lock():
+                try:
+                    upload.append(0, io.BytesIO(b'world'), 10)
+                except uploads.UploadOffsetMismatch as error:
+                    errors.append(error)
+
+        with upload.lock():
+            other = threading.Thread(target=append_again)
+            other.start()
+            # The other request waits for the lock instead of appending
+            other.join(0.2)
+            self.assertTrue(other.is_alive())
+            upload.append(0, io.BytesIO(b'hello'), 10)
+        other.join()
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(upload.offset, 5)
+
+    def test_purge_abandoned(self):
+        """Test uploads past their expiry are removed, others kept"""
+        stale = uploads.ResumableUpload('value-1', 'image')
+        fresh = uploads.ResumableUpload('value-2', 'image')
+        for upload in (stale, fresh):
+            with upload.lock():
+                upload.append(0, io.BytesIO(b'data'), 10)
+        an_hour_ago = time.time() - 3600
+        os.utime(stale.path, (an_hour_ago, an_hour_ago))
+
+        removed = uploads.purge_abandoned(max_age=60)
+
+        self.assertEqual(removed, 1)
+        self.assertEqual(stale.offset, 0)
+        self.assertEqual(fresh.offset, 4)
+
+    def test_purge_skips_upload_in_progress(self):
+        """Test an upload being appended to is not removed"""
+        upload = uploads.ResumableUpload('value-1', 'image')
+        with upload.lock():
+            upload.append(0, io.BytesIO(b'data'), 10)
+        an_hour_ago = time.time() - 3600
+        os.utime(upload.path, (an_hour_ago, an_hour_ago))
+
+        with open(upload.path, 'ab') as partial:
+            fcntl.flock(partial, fcntl.LOCK_EX)
+            removed = uploads.purge_abandoned(max_age=60)
+
+        self.assertEqual(removed, 0)
+        self.assertEqual(upload.offset, 4)
+
+
+class UploadHandlerTests(SimpleTestCase):
+    """Test upload limits outside the API"""
+
+    @override_settings(UPLOAD_SIZE_LIMITS={'image': 100})
+    def test_too_large_outside_api_bad_request(self):
+        """Test views that are not API views answer 400, not 500"""
+        image_file = io.BytesIO(b'x' * 1000)
+        image_file.name = 'large.jpg'
+
+        with self.assertLogs('django.security', 'ERROR'):
+            res = self.client.post('/admin/login/', {'image': image_file})
+
+        self.assertEqual(res.status_code, 400)
@@ -0,0 +1,125 @@
+"""
+Test for the health check and media endpoints
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import IoTDevice, DeviceValue, ToDoList
+
+HEALTHZ_URL = reverse('healthz')
+READYZ_URL = reverse('readyz')
+
+
+class HealthCheckTests(SimpleTestCase):
+    """Test liveness and readiness probes"""
+
+    def test_healthz(self):
+        """Test liveness does not depend on the database"""
+        res = self.client.get(HEALTHZ_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    @patch('core.views.database_available', return_value=True)
+    def test_readyz_database_available(self, patched_available):
+        """Test readiness once the database can be reached"""
+        res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 200)
+        patched_available.assert_called_once_with()
+
+    @patch('core.views.database_available', return_value=False)
+    def test_readyz_database_unavailable(self, patched_available):
+        """Test readiness fails while the database is down"""
+        res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 503)
+
+
+def media_url(name):
+    return reverse('media', args=[name])
+
+
+class ProtectedMediaTests(TestCase):
+    """Test media is only served to its owner"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='owner@example.com',
+            password='testpass123',
+        )
+        device = IoTDevice.objects.create(
+            user=self.user,
+            device_name='ESP32',
+            device_purpose='Traffic',
+        )
+        self.value = DeviceValue.objects.create(
+            user=self.user,
+            device=device,
+            value=1,
+        )
+        self.value.image.save('image.jpg', ContentFile(b'jpeg'), save=True)
+        self.todo = ToDoList.objects.create(user=self.user, title='Todo')
+        self.todo.related_file.save(
+            'notes.txt',
+            ContentFile(b'notes'),
+            save=True,
+        )
+
+    def tearDown(self):
+        self.value.image.delete()
+        self.todo.related_file.delete()
+
+    def test_auth_required(self):
+        """Test anonymous requests are refused"""
+        res = self.client.get(media_url(self.value.image.name))
+
+        self.assertEqual(res.status_code, 401)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_owner_redirected_to_nginx(self):
+        """Test the owner's download is handed back to nginx"""
+        self.client.force_authenticate(self.user)
+        res = self.client.get(media_url(self.value.image.name))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            f'/protected-media/{self.value.image.name}',
+        )
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res.content, b'')
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='')
+    def test_owner_served_without_nginx(self):
+        """Test the file is streamed by Django when nginx is not used"""
+        self.client.force_authenticate(self.user)
+        res = self.client.get(media_url(self.todo.related_file.name))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), b'notes')
+
+    def test_other_user_not_found(self):
+        """Test files of other users are not served"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(other)
+
+        for name in [self.value.image.name, self.todo.related_file.name]:
+            res = self.client.get(media_url(name))
+            self.assertEqual(res.status_code, 404)
+
+    def test_path_traversal_not_found(self):
+        """Test paths escaping the upload directories are refused"""
+        self.client.force_authenticate(self.user)
+        name = f'uploads/files/../../{self.todo.related_file.name}'
+        res = self.client.get(media_url(name))
+
+        self.assertEqual(res.status_code, 404)
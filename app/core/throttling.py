@@ -0,0 +1,147 @@
+"""
+Token bucket throttling held in shared memory.
+
+Under uWSGI the buckets live in a uWSGI cache (``--cache2``) that all
+workers of the instance share, so checking a limit costs neither a
+database nor a network round trip. Elsewhere (runserver, tests, management
+commands) each process keeps its own buckets.
+"""
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import SimpleRateThrottle
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+# Tokens left and the time they were counted at
+BUCKET = struct.Struct('dd')
+
+
+class LocalBuckets:
+    """Buckets of the current process"""
+
+    # Idle buckets are dropped once this many are held
+    MAX_BUCKETS = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            yield
+
+    def get(self, key):
+        bucket = self.buckets.get(key)
+        return bucket and bucket[:2]
+
+    def set(self, key, tokens, updated, expires):
+        if len(self.buckets) >= self.MAX_BUCKETS:
+            self.buckets = {
+                key: bucket for key, bucket in self.buckets.items()
+                if bucket[2] > updated
+            }
+        self.buckets[key] = (tokens, updated, updated + expires)
+
+
+class UwsgiBuckets:
+    """Buckets in a uWSGI cache shared by all workers"""
+
+    def __init__(self, name):
+        self.name = name
+
+    @contextmanager
+    def locked(self):
+        # Reading and updating a bucket must not interleave between workers
+        uwsgi.lock()
+        try:
+            yield
+        finally:
+            uwsgi.unlock()
+
+    def get(self, key):
+        data = uwsgi.cache_get(key, self.name)
+        return data and BUCKET.unpack(data)
+
+    def set(self, key, tokens, updated, expires):
+        uwsgi.cache_update(
+            key,
+            BUCKET.pack(tokens, updated),
+            int(expires) + 1,
+            self.name,
+        )
+
+
+if uwsgi is not None and settings.THROTTLE_UWSGI_CACHE:
+    buckets = UwsgiBuckets(settings.THROTTLE_UWSGI_CACHE)
+else:
+    buckets = LocalBuckets()
+
+
+def take(key, rate, capacity, now=None, cost=1):
+    """Take tokens from a bucket.
+
+    The bucket holds up to ``capacity`` tokens and refills at ``rate``
+    tokens per second. Returns 0 if ``cost`` tokens were taken, otherwise
+    the seconds until they are available. A full bucket pays for any cost,
+    going into debt that later requests wait out, so costs above the
+    capacity are still possible at the same average rate.
+    """
+    now = time.time() if now is None else now
+    with buckets.locked():
+        tokens, updated = buckets.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + max(0, now - updated) * rate)
+        needed = min(cost, capacity)
+        if tokens < needed:
+            return (needed - tokens) / rate
+        # A bucket that is full again is the same as a missing one
+        tokens -= cost
+        buckets.set(key, tokens, now, (capacity - tokens) / rate)
+    return 0
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Throttle on a token bucket instead of a history in the cache.
+
+    A rate of ``n/period`` allows bursts of n requests and refills n
+    tokens per period. Subclasses set ``scope`` and ``get_cache_key``, and
+    may charge more than one token for a request with ``get_cost``.
+    """
+
+    def get_cost(self, request, view):
+        """Return the tokens a request takes"""
+        return 1
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.wait_seconds = take(
+            self.key,
+            self.num_requests / self.duration,
+            self.num_requests,
+            cost=self.get_cost(request, view),
+        )
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class WriteTokenBucketThrottle(TokenBucketThrottle):
+    """Token bucket throttle that lets safe methods through"""
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        return super().allow_request(request, view)
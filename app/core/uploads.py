@@ -0,0 +1,237 @@
+"""
+Streaming and resumable upload handling.
+
+Uploads are streamed into FILE_UPLOAD_TEMP_DIR, which lives on the same
+volume as MEDIA_ROOT, so saving them to their final path is a rename
+instead of a second copy. A SHA-256 checksum is computed while the chunks
+arrive and size limits are enforced per form field as soon as they are
+crossed.
+
+The upload handler runs for every view, so it only raises Django's
+RequestDataTooBig (a 400 outside the API). StreamingMultiPartParser turns
+it into a 413 and checks the checksum for API views.
+"""
+import contextlib
+import fcntl
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import exceptions, parsers, status
+
+CHECKSUM_HEADER = 'HTTP_X_CONTENT_SHA256'
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded file is too large.'
+    default_code = 'upload_too_large'
+
+
+class ChecksumMismatch(exceptions.ValidationError):
+    default_detail = 'Uploaded file does not match its checksum.'
+    default_code = 'checksum_mismatch'
+
+
+class UploadOffsetMismatch(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Upload offset does not match the received data.'
+    default_code = 'upload_offset_mismatch'
+
+
+def upload_limit(field_name):
+    """Return the maximum size in bytes for files of a form field"""
+    return settings.UPLOAD_SIZE_LIMITS.get(
+        field_name,
+        settings.UPLOAD_DEFAULT_SIZE_LIMIT,
+    )
+
+
+def ensure_temp_dir(*parts):
+    """Create and return a directory under FILE_UPLOAD_TEMP_DIR"""
+    path = os.path.join(settings.FILE_UPLOAD_TEMP_DIR, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def check_checksum(request, sha256):
+    """Raise ChecksumMismatch if the client sent a different checksum"""
+    expected = request.META.get(CHECKSUM_HEADER)
+    if expected and expected.lower() != sha256:
+        raise ChecksumMismatch()
+
+
+class StreamingUploadHandler(TemporaryFileUploadHandler):
+    """Stream files to disk next to MEDIA_ROOT while hashing them"""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        """Reject bodies that cannot fit any limit before reading them"""
+        largest = max(
+            [settings.UPLOAD_DEFAULT_SIZE_LIMIT,
+             *settings.UPLOAD_SIZE_LIMITS.values()]
+        )
+        if content_length and content_length > largest + CHUNK_SIZE:
+            raise RequestDataTooBig(UploadTooLarge.default_detail)
+
+    def new_file(self, field_name, *args, **kwargs):
+        ensure_temp_dir()
+        super().new_file(field_name, *args, **kwargs)
+        self.limit = upload_limit(field_name)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.limit:
+            self.upload_interrupted()
+            raise RequestDataTooBig(
+                f'{self.field_name} is larger than {self.limit} bytes.'
+            )
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.digest.hexdigest()
+        return uploaded
+
+
+class StreamingMultiPartParser(parsers.MultiPartParser):
+    """Multipart parser reporting upload handler errors as API errors"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            data_and_files = super().parse(stream, media_type, parser_context)
+        except RequestDataTooBig as error:
+            raise UploadTooLarge(str(error))
+        request = parser_context['request']
+        for _, files in data_and_files.files.lists():
+            for uploaded in files:
+                if hasattr(uploaded, 'sha256'):
+                    check_checksum(request, uploaded.sha256)
+        return data_and_files
+
+
+class ResumedFile(File):
+    """A completed resumable upload, moved into storage by rename"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def resumable_dir():
+    """Return the directory holding partial resumable uploads"""
+    return ensure_temp_dir('resumable')
+
+
+class ResumableUpload:
+    """Partial file a flaky client can append to across requests.
+
+    The number of bytes already on disk is the upload offset; a client
+    that lost its connection asks for it and continues from there.
+    Requests changing the upload hold lock(), and uploads left alone for
+    UPLOAD_RESUMABLE_EXPIRY seconds are removed by purge_abandoned().
+    """
+
+    def __init__(self, key, field_name):
+        self.path = os.path.join(resumable_dir(), f'{key}.part')
+        self.limit = upload_limit(field_name)
+
+    @property
+    def offset(self):
+        """Number of bytes received so far"""
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Hold the partial file exclusively, so one request appends"""
+        while True:
+            partial = open(self.path, 'ab')
+            fcntl.flock(partial, fcntl.LOCK_EX)
+            # Completed or purged while waiting, lock the new file instead
+            try:
+                current = os.path.samestat(
+                    os.fstat(partial.fileno()),
+                    os.stat(self.path),
+                )
+            except FileNotFoundError:
+                current = False
+            if current:
+                break
+            partial.close()
+        try:
+            yield
+        finally:
+            partial.close()
+
+    def append(self, offset, stream, total):
+        """Append stream at offset and return the new offset.
+
+        Callers hold lock(), otherwise two requests at the same offset
+        could both append.
+        """
+        if total > self.limit:
+            raise UploadTooLarge(f'Uploads are limited to {self.limit} bytes.')
+        if offset != self.offset:
+            raise UploadOffsetMismatch()
+
+        with open(self.path, 'ab') as partial:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                offset += len(chunk)
+                if offset > total:
+                    partial.truncate(total)
+                    raise UploadOffsetMismatch(
+                        'Received more data than the declared length.'
+                    )
+                partial.write(chunk)
+        return offset
+
+    def sha256(self):
+        """Return the SHA-256 of the data received so far"""
+        digest = hashlib.sha256()
+        with open(self.path, 'rb') as partial:
+            for chunk in iter(lambda: partial.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def open(self, name):
+        """Return the completed upload as a file storage can move"""
+        return ResumedFile(
+            open(self.path, 'rb'),
+            name=os.path.basename(name),
+        )
+
+    def discard(self):
+        """Remove the partial file"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def purge_abandoned(max_age=None):
+    """Remove resumable uploads not appended to for max_age seconds"""
+    max_age = max_age or settings.UPLOAD_RESUMABLE_EXPIRY
+    removed = 0
+    with os.scandir(resumable_dir()) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.part'):
+                continue
+            with open(entry.path, 'ab') as partial:
+                try:
+                    fcntl.flock(partial, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Being appended to right now
+                    continue
+                changed = os.fstat(partial.fileno()).st_mtime
+                if time.time() - changed >= max_age:
+                    os.remove(entry.path)
+                    removed += 1
+    return removed
@@ -1,6 +1,73 @@
-from django.shortcuts import render  # NOQA
-from django.http import HttpResponse
+"""
+Views for the core app
+"""
+import mimetypes
+import posixpath
 
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from drf_spectacular.utils import extend_schema
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import (
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from rest_framework.permissions import IsAuthenticated
 
-# Create your views here.
+from core.health import database_available
+from core.models import DeviceValue, ToDoList
 
+
+def healthz(request):
+    """Liveness probe, the process is up and serving requests"""
+    return JsonResponse({'status': 'ok'})
+
+
+def readyz(request):
+    """Readiness probe, the database can be reached"""
+    if database_available():
+        return JsonResponse({'status': 'ok'})
+    return JsonResponse({'status': 'unavailable'}, status=503)
+
+
+def media_owned_by(user, name):
+    """Return True if the media file belongs to one of user's records"""
+    if name.startswith('uploads/images/'):
+        return DeviceValue.objects.filter(
+            image=name,
+            device__user=user,
+        ).exists()
+    if name.startswith('uploads/files/'):
+        return ToDoList.objects.filter(
+            related_file=name,
+            user=user,
+        ).exists()
+    return False
+
+
+@extend_schema(exclude=True)
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def protected_media(request, path):
+    """Serve a media file to its owner, through nginx when available"""
+    name = posixpath.normpath(path)
+    if name != path or not media_owned_by(request.user, name):
+        raise Http404('File not found.')
+
+    if settings.MEDIA_ACCEL_REDIRECT:
+        # nginx streams the file from its internal location, the worker
+        # is released as soon as this response is sent.
+        content_type, encoding = mimetypes.guess_type(name)
+        response = HttpResponse(
+            content_type=content_type or 'application/octet-stream',
+        )
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT + name
+        return response
+
+    try:
+        return FileResponse(default_storage.open(name))
+    except FileNotFoundError:
+        raise Http404('File not found.')
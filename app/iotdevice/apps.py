@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class IotdeviceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'iotdevice'
+
+    def ready(self):
+        from iotdevice import authentication, ownership, signals  # noqa: F401
@@ -0,0 +1,122 @@
+"""
+Authentication with per device API keys.
+
+Devices send ``Authorization: Device <prefix>.<secret>``. The key is looked
+up by its prefix, from the cache when it is shared by all workers so a
+reading costs no authentication query, and its secret is compared to the
+stored HMAC in constant time.
+"""
+import hmac
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import authentication, exceptions
+
+from core import caching
+from core.models import DeviceAPIKey, IoTDevice, User, api_key_digest
+
+PREFIX_RE = re.compile(r'^[0-9a-f]{8}$')
+
+
+def api_key_cache_key(prefix):
+    """Return the cache key holding a device key"""
+    return f'iotdevice:apikey:{prefix}'
+
+
+def get_api_key(prefix):
+    """Return the active key with a prefix, or None.
+
+    Keys are only cached in a shared cache, where revoking a key or
+    changing its device or owner reaches every worker at once. Unknown
+    and revoked prefixes are cached in any cache, as False, since they
+    grant nothing.
+    """
+    key = api_key_cache_key(prefix)
+    api_key = cache.get(key)
+    if api_key is None:
+        api_key = DeviceAPIKey.objects.select_related('device__user').filter(
+            prefix=prefix,
+            revoked_at__isnull=True,
+        ).first() or False
+        if not api_key or caching.cache_is_shared():
+            cache.set(key, api_key, settings.DEVICE_CACHE_TIMEOUT)
+    return api_key or None
+
+
+def authenticate_key(raw_key):
+    """Return the active key matching ``<prefix>.<secret>``, or None"""
+    prefix, _, secret = raw_key.partition('.')
+    digest = api_key_digest(secret)
+    api_key = get_api_key(prefix) if PREFIX_RE.match(prefix) else None
+    if api_key is None or not hmac.compare_digest(api_key.digest, digest):
+        return None
+    return api_key
+
+
+class DeviceAPIKeyAuthentication(authentication.BaseAuthentication):
+    """Authenticate a device as its owner, limited to that device.
+
+    ``request.auth`` is the DeviceAPIKey, which DeviceKeyScope uses to keep
+    the request to writing readings for the key's device.
+    """
+    keyword = 'Device'
+
+    def authenticate(self, request):
+        auth = authentication.get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(
+                'Invalid device key header.'
+            )
+
+        try:
+            api_key = authenticate_key(auth[1].decode())
+        except UnicodeError:
+            api_key = None
+        if api_key is None:
+            raise exceptions.AuthenticationFailed('Invalid device key.')
+
+        user = api_key.device.user
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return (user, api_key)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+def invalidate_prefixes(prefixes):
+    """Drop cached keys now and after commit, when nothing re-caches them"""
+    keys = [api_key_cache_key(prefix) for prefix in prefixes]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=DeviceAPIKey)
+@receiver(post_delete, sender=DeviceAPIKey)
+def invalidate_api_key(sender, instance, **kwargs):
+    """Drop the cached key when it is created, revoked or deleted"""
+    invalidate_prefixes([instance.prefix])
+
+
+@receiver(post_save, sender=IoTDevice)
+def invalidate_device_keys(sender, instance, created, **kwargs):
+    """Drop the cached keys of a device, which hold it and its owner"""
+    if not created and caching.cache_is_shared():
+        invalidate_prefixes(
+            instance.api_keys.values_list('prefix', flat=True)
+        )
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_keys(sender, instance, created, **kwargs):
+    """Drop the cached keys of a user's devices, e.g. when deactivated"""
+    if not created and caching.cache_is_shared():
+        invalidate_prefixes(DeviceAPIKey.objects.filter(
+            device__user=instance,
+        ).values_list('prefix', flat=True))
@@ -0,0 +1,127 @@
+"""
+Write-behind ingestion buffer for device values.
+
+Accepted readings are appended to a local SQLite spool (WAL journal,
+synchronous writes) and flushed into Postgres in batches by the
+``flush_ingest_buffer`` management command. Rows are only removed from the
+spool after the batch has been committed, so nothing accepted is lost when
+either process restarts.
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import rollups
+from core.models import (
+    IoTDevice,
+    DeviceValue,
+)
+
+SPOOL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    accepted_at TEXT NOT NULL
+)
+"""
+
+_local = threading.local()
+
+
+def is_enabled():
+    """Return True when buffered ingestion is configured"""
+    return bool(settings.INGEST_BUFFER_PATH)
+
+
+def get_connection():
+    """Return the spool connection for this thread and process"""
+    path = settings.INGEST_BUFFER_PATH
+    key = (os.getpid(), path)
+    if getattr(_local, 'key', None) != key:
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=FULL')
+        connection.execute(SPOOL_SCHEMA)
+        _local.key = key
+        _local.connection = connection
+    return _local.connection
+
+
+def append(device, user, data):
+    """Durably store a validated reading and return its spool id"""
+    cursor = get_connection().execute(
+        'INSERT INTO spool (device_id, user_id, payload, accepted_at) '
+        'VALUES (?, ?, ?, ?)',
+        (
+            device.id,
+            user.id,
+            # Capture times keep their microseconds
+            json.dumps(data, default=datetime.isoformat),
+            timezone.now().isoformat(),
+        ),
+    )
+    return cursor.lastrowid
+
+
+def pending():
+    """Return the number of readings waiting to be flushed"""
+    return get_connection().execute('SELECT COUNT(*) FROM spool').fetchone()[0]
+
+
+def insert_values(values):
+    """Insert a batch of unsaved DeviceValue instances in one transaction"""
+    # Retried readings that were already stored are skipped by the
+    # idempotency key constraint (ON CONFLICT DO NOTHING).
+    with transaction.atomic():
+        DeviceValue.objects.bulk_create(values, ignore_conflicts=True)
+        rollups.mark_dirty(values)
+
+
+def flush(batch_size=None):
+    """Insert the oldest batch of spooled readings, return how many"""
+    batch_size = batch_size or settings.INGEST_BUFFER_BATCH_SIZE
+    connection = get_connection()
+    rows = connection.execute(
+        'SELECT id, device_id, user_id, payload, accepted_at FROM spool '
+        'ORDER BY id LIMIT ?',
+        (batch_size,),
+    ).fetchall()
+    if not rows:
+        return 0
+
+    # Readings for devices deleted since they were accepted are dropped,
+    # the same way the delete would have cascaded to them.
+    existing = set(IoTDevice.objects.filter(
+        id__in={row[1] for row in rows},
+    ).values_list('id', flat=True))
+    # Readings without a capture time were taken when they were accepted,
+    # not when they are flushed.
+    values = []
+    for _, device_id, user_id, data, accepted_at in rows:
+        if device_id not in existing:
+            continue
+        payload = json.loads(data)
+        payload['taken_at'] = parse_datetime(
+            payload.get('taken_at') or accepted_at
+        )
+        values.append(DeviceValue(
+            device_id=device_id,
+            user_id=user_id,
+            **payload,
+        ))
+    insert_values(values)
+
+    connection.execute(
+        'DELETE FROM spool WHERE id <= ?',
+        (rows[-1][0],),
+    )
+    return len(rows)
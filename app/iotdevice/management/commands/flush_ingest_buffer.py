@@ -0,0 +1,47 @@
+"""
+Django command to flush buffered device values into the database
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from iotdevice import buffer
+
+
+class Command(BaseCommand):
+    """Django command to move spooled readings into DeviceValue rows"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Flush everything pending and exit instead of looping.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.INGEST_BUFFER_FLUSH_INTERVAL,
+            help='Seconds to wait between flushes when the spool is empty.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.INGEST_BUFFER_BATCH_SIZE,
+            help='Maximum readings inserted per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for commands"""
+        if not buffer.is_enabled():
+            raise CommandError('INGEST_BUFFER_PATH is not configured')
+
+        self.stdout.write(f'Flushing {settings.INGEST_BUFFER_PATH}...')
+        while True:
+            flushed = buffer.flush(options['batch_size'])
+            if flushed:
+                self.stdout.write(f'Flushed {flushed} values')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
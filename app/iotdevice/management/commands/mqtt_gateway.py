@@ -0,0 +1,81 @@
+"""
+Django command to ingest device values published over MQTT
+"""
+import functools
+import time
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from iotdevice.mqtt import Gateway
+
+
+class Command(BaseCommand):
+    """Django command to run the MQTT ingestion gateway"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.MQTT_BATCH_SIZE,
+            help='Maximum readings inserted per transaction.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.MQTT_FLUSH_INTERVAL,
+            help='Seconds a reading may wait for its batch to fill.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for commands"""
+        gateway = Gateway(options['batch_size'], options['interval'])
+
+        # A persistent session keeps unacknowledged messages at the broker
+        # while the gateway restarts.
+        client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=settings.MQTT_CLIENT_ID,
+            clean_session=False,
+            manual_ack=True,
+        )
+        if settings.MQTT_USERNAME:
+            client.username_pw_set(
+                settings.MQTT_USERNAME,
+                settings.MQTT_PASSWORD,
+            )
+
+        def on_connect(client, userdata, flags, reason_code, properties):
+            self.stdout.write(f'Connected to {settings.MQTT_HOST}, '
+                              f'subscribing to {settings.MQTT_TOPIC}')
+            client.subscribe(settings.MQTT_TOPIC, qos=1)
+
+        def on_disconnect(client, userdata, flags, reason_code, properties):
+            # Acks are only valid on the connection the messages came in
+            self.stdout.write(f'Disconnected ({reason_code})')
+            gateway.discard()
+
+        def on_message(client, userdata, message):
+            gateway.handle(
+                message.topic,
+                message.payload,
+                functools.partial(client.ack, message.mid, message.qos),
+            )
+
+        client.on_connect = on_connect
+        client.on_disconnect = on_disconnect
+        client.on_message = on_message
+        client.connect(settings.MQTT_HOST, settings.MQTT_PORT, keepalive=60)
+
+        while True:
+            if client.loop(timeout=gateway.interval) != mqtt.MQTT_ERR_SUCCESS:
+                time.sleep(1)
+                try:
+                    client.reconnect()
+                except OSError as error:
+                    self.stdout.write(f'Reconnect failed: {error}')
+                continue
+            flushed = gateway.flush_due()
+            if flushed:
+                self.stdout.write(f'Stored {flushed} messages')
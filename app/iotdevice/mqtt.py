@@ -0,0 +1,118 @@
+"""
+MQTT ingestion gateway.
+
+Sensors keep a TLS connection to the broker open and publish readings to
+their device topic (``devices/<device id>/values`` by default), each with
+the device's API key in its ``key`` field. The gateway checks the key is
+an active key of that device, validates every message with
+DeviceValueSerializer and inserts the readings in batches. Messages are
+acknowledged to the broker only once their batch is committed, so readings
+of a gateway that stops are delivered again.
+"""
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from core.models import DeviceValue
+from iotdevice import buffer
+from iotdevice.authentication import authenticate_key
+from iotdevice.serializers import DeviceValueSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class Rejected(Exception):
+    """A message that cannot be stored"""
+
+
+def device_id_from_topic(topic):
+    """Return the device id matched by the ``+`` of MQTT_TOPIC"""
+    pattern = settings.MQTT_TOPIC.split('/')
+    parts = topic.split('/')
+    if len(parts) != len(pattern):
+        raise Rejected(f'Unexpected topic {topic}')
+    return parts[pattern.index('+')]
+
+
+class Gateway:
+    """Validate readings from MQTT messages and store them in batches"""
+
+    def __init__(self, batch_size=None, interval=None):
+        self.batch_size = batch_size or settings.MQTT_BATCH_SIZE
+        self.interval = interval or settings.MQTT_FLUSH_INTERVAL
+        # (DeviceValue or None, ack) in the order messages arrived
+        self.pending = []
+        self.flushed_at = time.monotonic()
+
+    def authenticate(self, topic, raw_key):
+        """Return the device of topic if raw_key is one of its keys"""
+        if not isinstance(raw_key, str):
+            raise Rejected('Missing device key')
+        # Unknown prefixes are cached as well, repeating a forged key
+        # costs no query
+        api_key = authenticate_key(raw_key)
+        if api_key is None:
+            raise Rejected('Invalid device key')
+        if str(api_key.device_id) != device_id_from_topic(topic):
+            raise Rejected('Key is for another device')
+        if not api_key.device.user.is_active:
+            raise Rejected('Device owner is inactive')
+        return api_key.device
+
+    def read(self, topic, payload):
+        """Return the unsaved reading carried by a message"""
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            raise Rejected('Payload is not JSON')
+        if not isinstance(data, dict):
+            raise Rejected('Payload is not an object')
+
+        device = self.authenticate(topic, data.pop('key', None))
+
+        serializer = DeviceValueSerializer(data=data)
+        if not serializer.is_valid():
+            raise Rejected(serializer.errors)
+        return DeviceValue(
+            device=device,
+            user=device.user,
+            **serializer.validated_data,
+        )
+
+    def handle(self, topic, payload, ack=None):
+        """Queue the reading of a message, flushing full batches"""
+        try:
+            value = self.read(topic, payload)
+        except Rejected as error:
+            # Acknowledged anyway, a redelivery would be rejected again
+            logger.warning('Rejected message on %s: %s', topic, error)
+            value = None
+        self.pending.append((value, ack))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert the pending readings, then acknowledge their messages"""
+        if self.pending:
+            buffer.insert_values([
+                value for value, _ in self.pending if value is not None
+            ])
+            for _, ack in self.pending:
+                if ack is not None:
+                    ack()
+        flushed = len(self.pending)
+        self.pending = []
+        self.flushed_at = time.monotonic()
+        return flushed
+
+    def flush_due(self):
+        """Flush when the oldest pending reading waited long enough"""
+        if time.monotonic() - self.flushed_at >= self.interval:
+            return self.flush()
+        return 0
+
+    def discard(self):
+        """Forget pending readings, the broker delivers them again"""
+        self.pending = []
@@ -0,0 +1,59 @@
+"""
+Cached resolution of the device a request is allowed to write to
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404
+
+from core import caching
+from core.models import IoTDevice
+
+
+def device_cache_key(device_id):
+    """Return the cache key holding a device instance"""
+    return f'iotdevice:device:{device_id}'
+
+
+def get_owned_device(user, device_id):
+    """Return the device if it belongs to user, raise Http404 otherwise.
+
+    With a shared cache, device instances are cached by id and the owner
+    is compared in memory, so repeated readings for the same device do not
+    hit the database.
+    """
+    try:
+        device_id = int(device_id)
+    except (TypeError, ValueError):
+        raise Http404('Device not found.')
+
+    if not caching.cache_is_shared():
+        # Other workers would not see invalidations, check in the query
+        device = IoTDevice.objects.filter(pk=device_id, user=user).first()
+        if device is None:
+            raise Http404('Device not found.')
+        return device
+
+    key = device_cache_key(device_id)
+    device = cache.get(key)
+    if device is None:
+        device = IoTDevice.objects.filter(pk=device_id).first()
+        if device is None:
+            raise Http404('Device not found.')
+        cache.set(key, device, settings.DEVICE_CACHE_TIMEOUT)
+
+    if device.user_id != user.pk:
+        raise Http404('Device not found.')
+    return device
+
+
+@receiver(post_save, sender=IoTDevice)
+@receiver(post_delete, sender=IoTDevice)
+def invalidate_device(sender, instance, **kwargs):
+    """Drop the cached device when it is changed, reassigned or deleted"""
+    key = device_cache_key(instance.pk)
+    cache.delete(key)
+    # Again after commit, a request may have cached the old row meanwhile
+    transaction.on_commit(lambda: cache.delete(key))
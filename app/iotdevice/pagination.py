@@ -0,0 +1,10 @@
+"""
+Pagination for IoT Device app
+"""
+from rest_framework.pagination import PageNumberPagination
+
+
+class DeviceValuePagination(PageNumberPagination):
+    """Page numbers, with a client chosen page size of up to 1000"""
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
@@ -0,0 +1,67 @@
+"""
+Parsers for IoT Device app
+"""
+from datetime import datetime, timezone
+
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+# Positions of a packed reading. Only the first five are required.
+READING_FIELDS = [
+    'value',
+    'car_count',
+    'motorcycle_count',
+    'smalltruck_count',
+    'bigvehicle_count',
+    'taken_at',
+    'idempotency_key',
+]
+
+
+def unpack_reading(reading):
+    """Turn a packed reading into the fields DeviceValueSerializer takes"""
+    if not isinstance(reading, list) or not (
+        5 <= len(reading) <= len(READING_FIELDS)
+    ):
+        raise ParseError(
+            'A reading is an array of 5 to 7 items: value, car_count, '
+            'motorcycle_count, smalltruck_count, bigvehicle_count, '
+            'taken_at and idempotency_key.'
+        )
+    data = dict(zip(READING_FIELDS, reading))
+    # Capture times are msgpack timestamps or seconds since the epoch,
+    # and both optional items may be nil to skip them.
+    taken_at = data.get('taken_at')
+    if taken_at is None:
+        data.pop('taken_at', None)
+    elif isinstance(taken_at, (int, float)):
+        try:
+            data['taken_at'] = datetime.fromtimestamp(taken_at, timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ParseError('taken_at is out of range.')
+    if data.get('idempotency_key', '') is None:
+        del data['idempotency_key']
+    return data
+
+
+class ReadingMsgPackParser(BaseParser):
+    """MessagePack parser for readings packed as fixed position arrays.
+
+    A single reading is ``[value, car_count, motorcycle_count,
+    smalltruck_count, bigvehicle_count]`` with optional ``taken_at`` and
+    ``idempotency_key`` items; a batch is an array of readings. Without
+    field names the five counts pack into 6 bytes instead of about 100 as
+    JSON.
+    """
+    media_type = 'application/vnd.curious.reading+msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            data = msgpack.unpackb(stream.read(), timestamp=3)
+        except ValueError as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+        if isinstance(data, list) and data and isinstance(data[0], list):
+            return [unpack_reading(reading) for reading in data]
+        return unpack_reading(data)
@@ -0,0 +1,23 @@
+"""
+Permissions for IoT Device app
+"""
+from rest_framework import permissions
+
+from core.models import DeviceAPIKey
+
+
+class DeviceKeyScope(permissions.BasePermission):
+    """Keep device API keys to the ingest actions of their own device.
+
+    Views list the actions a device key may call in ``device_key_actions``.
+    Requests authenticated otherwise are not affected.
+    """
+
+    def has_permission(self, request, view):
+        if not isinstance(request.auth, DeviceAPIKey):
+            return True
+        device_id = str(view.kwargs.get('device_pk'))
+        return (
+            view.action in getattr(view, 'device_key_actions', ())
+            and str(request.auth.device_id) == device_id
+        )
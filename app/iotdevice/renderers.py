@@ -0,0 +1,69 @@
+"""
+Renderers for IoT Device app
+"""
+import msgpack
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+def to_columns(data):
+    """Turn a list of rows, or a paginated page of rows, into columns.
+
+    Nested objects (like ``device``) are flattened into dotted column names
+    so every column is a flat array. Anything that is not a list of rows
+    (errors, single objects) is returned untouched.
+    """
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        page = dict(data)
+        page['results'] = to_columns(data['results'])
+        return page
+    if not isinstance(data, list):
+        return data
+
+    rows = [_flatten(row) for row in data]
+    columns = {}
+    for row in rows:
+        for key in row:
+            columns.setdefault(key, [])
+    for row in rows:
+        for key, values in columns.items():
+            values.append(row.get(key))
+    return columns
+
+
+def _flatten(row, prefix=''):
+    """Flatten nested dicts of a row into dotted keys"""
+    flat = {}
+    for key, value in row.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(_flatten(value, prefix=f'{name}.'))
+        else:
+            flat[name] = value
+    return flat
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """JSON renderer returning column-oriented arrays"""
+    media_type = 'application/vnd.curious.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(
+            to_columns(data),
+            accepted_media_type,
+            renderer_context,
+        )
+
+
+class ColumnarMsgPackRenderer(BaseRenderer):
+    """MessagePack renderer returning column-oriented arrays"""
+    media_type = 'application/vnd.curious.columnar+msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(to_columns(data), default=str)
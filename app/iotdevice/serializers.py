@@ -1,12 +1,23 @@
+import copy
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 
+from core import rollups
 from core.models import (
     IoTDevice,
+    DeviceAPIKey,
     DeviceValue
 )
+from core.serializers import DynamicFieldsMixin
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
 
 
-class SimpleDeviceSerializer(serializers.ModelSerializer):
+class SimpleDeviceSerializer(DynamicFieldsMixin,
+                             serializers.ModelSerializer):
     """Simplified serializer for Device to avoid recursion in
     nested serialization"""
 
@@ -15,7 +26,7 @@ class SimpleDeviceSerializer(serializers.ModelSerializer):
         fields = ['id', 'device_name']
 
 
-class DeviceValueSerializer(serializers.ModelSerializer):
+class DeviceValueSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for the Device Value"""
     device = SimpleDeviceSerializer(read_only=True)
 
@@ -31,11 +42,69 @@ class DeviceValueSerializer(serializers.ModelSerializer):
             'smalltruck_count',
             'bigvehicle_count',
             'image',
+            'idempotency_key',
         ]
-        read_only_fields = ['id', 'taken_at']
+        read_only_fields = ['id']
+        expandable_fields = ['device']
 
+    def validate_taken_at(self, value):
+        """Accept capture times within the clock skew and backfill window"""
+        now = timezone.now()
+        if value > now + timedelta(seconds=settings.INGEST_MAX_CLOCK_SKEW):
+            raise serializers.ValidationError(
+                'Capture time is in the future, check the device clock.'
+            )
+        if value < now - timedelta(seconds=settings.INGEST_MAX_BACKFILL_AGE):
+            raise serializers.ValidationError(
+                'Capture time is older than the backfill window.'
+            )
+        return value
 
-class DeviceSerializer(serializers.ModelSerializer):
+    def validate(self, attrs):
+        """Take the idempotency key from the header if not in the body"""
+        if self.instance is not None:
+            # The key names the reading it was stored with, like a read
+            # only field it is ignored by updates
+            attrs.pop('idempotency_key', None)
+            return attrs
+        request = self.context.get('request')
+        # The header names a single reading, not each one of a batch
+        header = self.parent is None and request and request.headers.get(
+            IDEMPOTENCY_HEADER,
+        )
+        if header and not attrs.get('idempotency_key'):
+            attrs['idempotency_key'] = self.fields[
+                'idempotency_key'
+            ].run_validation(header)
+        return attrs
+
+    def create(self, validated_data):
+        """Insert unless the device already sent a reading with the key"""
+        key = validated_data.get('idempotency_key')
+        if not key:
+            device_value = super().create(validated_data)
+        else:
+            # ON CONFLICT DO NOTHING, then read back whichever row won
+            DeviceValue.objects.bulk_create(
+                [DeviceValue(**validated_data)],
+                ignore_conflicts=True,
+            )
+            device_value = DeviceValue.objects.get(
+                device=validated_data['device'],
+                idempotency_key=key,
+            )
+        rollups.mark_dirty([device_value])
+        return device_value
+
+    def update(self, instance, validated_data):
+        """Update a reading and mark the hours it is rolled up in dirty"""
+        before = copy.copy(instance)
+        instance = super().update(instance, validated_data)
+        rollups.mark_dirty([before, instance])
+        return instance
+
+
+class DeviceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for the Device model"""
     latest_value = serializers.SerializerMethodField()
 
@@ -50,22 +119,47 @@ class DeviceSerializer(serializers.ModelSerializer):
             'latest_value',
         ]
         read_only_fields = ['created_at', 'updated_at', 'id']
+        expandable_fields = ['latest_value']
 
     def get_latest_value(self, obj):
         """Get the latest DeviceValue for the Device"""
-        request = self.context.get('request', None)
-        if request and hasattr(request, 'user'):
-            latest_value = (obj.values.filter(user=request.user)
-                            .order_by('-taken_at').first())
-        else:
-            # If request is not available, do not filter by user
-            latest_value = obj.values.order_by('-taken_at').first()
+        # Values belong to the device's owner, no need to filter by user
+        latest_value = obj.values.order_by('-taken_at').first()
         if latest_value:
-            return DeviceValueSerializer(latest_value,
-                                         context=self.context).data
+            return DeviceValueSerializer(
+                latest_value,
+                context=self.context,
+                **self.get_nested_sparse('latest_value'),
+            ).data
         return None
 
 
+class DeviceAPIKeySerializer(serializers.ModelSerializer):
+    """Serializer for device API keys, without their secret"""
+
+    class Meta:
+        model = DeviceAPIKey
+        fields = ['id', 'name', 'prefix', 'created_at', 'revoked_at']
+        read_only_fields = ['id', 'prefix', 'created_at', 'revoked_at']
+
+
+class NewDeviceAPIKeySerializer(DeviceAPIKeySerializer):
+    """Serializer for a created device API key, the only time it is shown"""
+    key = serializers.CharField(read_only=True)
+
+    class Meta(DeviceAPIKeySerializer.Meta):
+        fields = DeviceAPIKeySerializer.Meta.fields + ['key']
+
+
+class BulkResultSerializer(serializers.Serializer):
+    """Serializer for the result of a batch of readings"""
+    count = serializers.IntegerField(help_text='Readings stored.')
+    duplicates = serializers.ListField(
+        child=serializers.CharField(),
+        help_text='Idempotency keys of readings skipped as already stored.',
+    )
+
+
 class ImageSerializer(serializers.ModelSerializer):
     """Serializer for the image"""
 
@@ -0,0 +1,25 @@
+"""
+Signal handlers keeping device representations fresh
+"""
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import IoTDevice, DeviceValue
+
+
+@receiver(post_save, sender=DeviceValue)
+def touch_device(sender, instance, created, **kwargs):
+    """Bump the device when a stored value is edited in place.
+
+    Devices render their latest value, and their ETag only sees which value
+    that is, so edits of its fields (value, counts, image) must change the
+    device's updated_at. New and deleted values change the ETag by id.
+    """
+    if created:
+        return
+    # A queryset update, so the device's own post_save receivers (cache
+    # invalidation) do not run for an unchanged device
+    IoTDevice.objects.filter(pk=instance.device_id).update(
+        updated_at=timezone.now(),
+    )
@@ -1,27 +1,48 @@
 """
 Test for IoT device API
 """
+import hashlib
+import io
+import json
 import tempfile
 import os
+from datetime import timedelta
+from unittest.mock import patch
 
+import msgpack
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core import throttling
 from core.models import (
     IoTDevice,
+    DeviceAPIKey,
     DeviceValue,
+    DeviceTrafficDirtyHour,
 )
 
-from iotdevice.serializers import DeviceSerializer
+from iotdevice import ownership
+from iotdevice.serializers import DeviceSerializer, DeviceValueSerializer
 
 DEVICE_URL = reverse('user:iotdevice-list')
 
+# A cache every worker sees, which cached ownership checks require
+SHARED_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'curious-test-cache'),
+    },
+}
+
 
 def reverse_value(device_id, value_id=0, action='detail'):
     """Reverse from device value"""
@@ -36,6 +57,14 @@ def reverse_value(device_id, value_id=0, action='detail'):
     )
 
 
+def reverse_bulk(device_id):
+    """Reverse the batch endpoint of device values"""
+    return reverse(
+        'user:device-value-bulk',
+        args=[device_id]
+    )
+
+
 def reverse_device_detail(device_id):
     return reverse(
         'user:iotdevice-detail',
@@ -43,6 +72,13 @@ def reverse_device_detail(device_id):
     )
 
 
+def reverse_latest_value(device_id):
+    return reverse(
+        'user:iotdevice-latest-value',
+        args=[device_id]
+    )
+
+
 def reverse_image(device_id, value_id):
     return reverse(
         'user:device-value-upload-image',
@@ -50,6 +86,27 @@ def reverse_image(device_id, value_id):
     )
 
 
+def reverse_resumable_image(device_id, value_id):
+    return reverse(
+        'user:device-value-resumable-image',
+        args=[device_id, value_id]
+    )
+
+
+def reverse_api_keys(device_id, key_id=None):
+    """Reverse the API keys of a device, or one of them"""
+    if key_id is None:
+        return reverse('user:iotdevice-api-keys', args=[device_id])
+    return reverse('user:iotdevice-api-key', args=[device_id, key_id])
+
+
+def jpeg_bytes():
+    """Return a small JPEG image"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (10, 10)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
 def create_device(user, **params):
     """Create a new device"""
     defaults = {
@@ -78,6 +135,30 @@ class PublicDeviceApiTests(TestCase):
         res = self.client.get(DEVICE_URL)
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    @override_settings(PUBLIC_CACHE_SECONDS=5)
+    def test_latest_value_shared_cache(self):
+        """Test public latest value may be cached by the proxy"""
+        user = create_user(email='public@example.com', password='test123')
+        device = create_device(user=user)
+        DeviceValue.objects.create(user=user, device=device, value=3)
+
+        res = self.client.get(reverse_latest_value(device.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['value'], 3)
+        cache_control = res['Cache-Control']
+        self.assertIn('public', cache_control)
+        self.assertIn('s-maxage=5', cache_control)
+        self.assertIn('Accept', res['Vary'])
+        self.assertEqual(res['Surrogate-Key'], f'device-{device.id}')
+
+    def test_latest_value_missing_device_cached(self):
+        """Test polls for unknown devices are cached too"""
+        res = self.client.get(reverse_latest_value(0))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn('public', res['Cache-Control'])
+
 
 class PrivateDeviceApiTests(TestCase):
     """Test authenticated device API access"""
@@ -106,6 +187,36 @@ class PrivateDeviceApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(response_ids, expected_ids)
 
+    def test_device_list_sparse_fields(self):
+        """Test devices can be listed without computing latest values"""
+        for _ in range(3):
+            device = create_device(user=self.user)
+            DeviceValue.objects.create(user=self.user, device=device, value=1)
+
+        # ETag watermark, count and page, none per device
+        with self.assertNumQueries(3):
+            res = self.client.get(DEVICE_URL, {'fields': 'id,device_name'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for device in res.data['results']:
+            self.assertEqual(set(device), {'id', 'device_name'})
+
+    def test_device_nested_sparse_fields(self):
+        """Test dotted fields select fields of the latest value"""
+        device = create_device(user=self.user)
+        DeviceValue.objects.create(user=self.user, device=device, value=4)
+
+        res = self.client.get(
+            reverse_device_detail(device.id),
+            {'fields': 'id,latest_value.value,latest_value.taken_at'},
+        )
+
+        self.assertEqual(set(res.data), {'id', 'latest_value'})
+        self.assertEqual(
+            set(res.data['latest_value']),
+            {'value', 'taken_at'},
+        )
+
     def test_devices_limited_to_user(self):
         """Test that retrieving devices for authenticated user is limited"""
         user2 = create_user(
@@ -122,7 +233,55 @@ class PrivateDeviceApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data['results'], serializer.data)
 
+    def test_device_list_not_modified(self):
+        """Test that an unchanged device list answers 304 to its ETag"""
+        device = create_device(user=self.user)
+
+        res = self.client.get(DEVICE_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        etag = res['ETag']
+
+        res = self.client.get(DEVICE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        value = DeviceValue.objects.create(
+            user=self.user,
+            device=device,
+            value=1,
+        )
+        res = self.client.get(DEVICE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+        # An older value of another device must not hide a deletion
+        DeviceValue.objects.create(
+            user=self.user,
+            device=create_device(user=self.user),
+            value=2,
+        )
+        etag = self.client.get(DEVICE_URL)['ETag']
+        value.delete()
+        res = self.client.get(DEVICE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_device_not_modified_edited_value(self):
+        """Test editing the latest value in place changes the device ETag"""
+        device = create_device(user=self.user)
+        value = DeviceValue.objects.create(device=device, value=1)
+        detail_url = reverse_device_detail(device.id)
+        list_etag = self.client.get(DEVICE_URL)['ETag']
+        detail_etag = self.client.get(detail_url)['ETag']
+
+        res = self.client.patch(reverse_value(device.id, value.id), {
+            'value': 4,
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+        res = self.client.get(DEVICE_URL, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['latest_value']['value'], 4)
+        res = self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
 
     def test_create_device(self):
         """Test creating a new device"""
@@ -227,6 +386,379 @@ class PrivateDeviceApiTests(TestCase):
         self.assertEqual(self.user, device_value.user)
         self.assertEqual(device, device_value.device)
 
+    def test_create_value_out_of_range(self):
+        """Test values outside 0-5 and negative counts are rejected"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+
+        for payload in [{'value': 6}, {'value': 1, 'car_count': -1}]:
+            res = self.client.post(url, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DeviceValue.objects.exists())
+
+    def test_create_value_buffered(self):
+        """Test buffered values are accepted first and stored on flush"""
+        device = create_device(user=self.user)
+        payload = {
+            'value': 2,
+            'motorcycle_count': 7,
+            'car_count': 3,
+        }
+        url = reverse_value(device_id=device.id, action='list')
+
+        with tempfile.TemporaryDirectory() as spool_dir:
+            spool = os.path.join(spool_dir, 'spool.sqlite3')
+            with override_settings(INGEST_BUFFER_PATH=spool):
+                res = self.client.post(url, payload)
+
+                self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+                self.assertFalse(DeviceValue.objects.exists())
+
+                call_command('flush_ingest_buffer', '--once')
+
+        device_value = DeviceValue.objects.get(device=device)
+        for key, value in payload.items():
+            self.assertEqual(getattr(device_value, key), value)
+        self.assertEqual(device_value.user, self.user)
+
+    def test_create_value_idempotent(self):
+        """Test a retried reading returns the original without a write"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+        payload = {'value': 2, 'idempotency_key': 'reading-1'}
+
+        res = self.client.post(url, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        retry = self.client.post(url, {**payload, 'value': 4})
+
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data['id'], res.data['id'])
+        self.assertEqual(retry.data['value'], 2)
+        self.assertEqual(DeviceValue.objects.count(), 1)
+
+    def test_create_value_idempotency_header(self):
+        """Test the key may be sent as a header, scoped per device"""
+        device = create_device(user=self.user)
+        other_device = create_device(user=self.user, device_name='Other')
+
+        for target in [device, device, other_device]:
+            self.client.post(
+                reverse_value(device_id=target.id, action='list'),
+                {'value': 1},
+                HTTP_IDEMPOTENCY_KEY='reading-1',
+            )
+
+        self.assertEqual(DeviceValue.objects.count(), 2)
+        self.assertEqual(
+            DeviceValue.objects.get(device=device).idempotency_key,
+            'reading-1',
+        )
+
+    def test_update_value_keeps_idempotency_key(self):
+        """Test updates cannot move a key onto another reading"""
+        device = create_device(user=self.user)
+        DeviceValue.objects.create(device=device, idempotency_key='taken')
+        value = DeviceValue.objects.create(device=device, value=1)
+        url = reverse_value(device.id, value.id)
+
+        res = self.client.patch(url, {'value': 2, 'idempotency_key': 'taken'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.patch(url, {'value': 3}, HTTP_IDEMPOTENCY_KEY='new')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        value.refresh_from_db()
+        self.assertEqual(value.value, 3)
+        self.assertIsNone(value.idempotency_key)
+
+    def test_create_value_idempotent_conflict(self):
+        """Test an insert racing a stored key returns the stored row"""
+        device = create_device(user=self.user)
+        original = DeviceValue.objects.create(
+            device=device,
+            value=2,
+            idempotency_key='reading-1',
+        )
+        serializer = DeviceValueSerializer(data={
+            'value': 4,
+            'idempotency_key': 'reading-1',
+        })
+        serializer.is_valid(raise_exception=True)
+
+        device_value = serializer.save(device=device)
+
+        self.assertEqual(device_value, original)
+        self.assertEqual(DeviceValue.objects.count(), 1)
+
+    def test_create_value_buffered_idempotent(self):
+        """Test retries spooled before the flush are stored once"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+
+        with tempfile.TemporaryDirectory() as spool_dir:
+            spool = os.path.join(spool_dir, 'spool.sqlite3')
+            with override_settings(INGEST_BUFFER_PATH=spool):
+                for _ in range(2):
+                    res = self.client.post(
+                        url,
+                        {'value': 2, 'idempotency_key': 'reading-1'},
+                    )
+                    self.assertEqual(
+                        res.status_code,
+                        status.HTTP_202_ACCEPTED,
+                    )
+                call_command('flush_ingest_buffer', '--once')
+
+                res = self.client.post(
+                    url,
+                    {'value': 2, 'idempotency_key': 'reading-1'},
+                )
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(DeviceValue.objects.filter(device=device).count(), 1)
+
+    def test_create_value_capture_time(self):
+        """Test devices may send when a reading was taken"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+        taken_at = timezone.now() - timedelta(days=1)
+
+        res = self.client.post(url, {
+            'value': 2,
+            'taken_at': taken_at.isoformat(),
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        device_value = DeviceValue.objects.get(id=res.data['id'])
+        self.assertEqual(device_value.taken_at, taken_at)
+        self.assertTrue(DeviceTrafficDirtyHour.objects.filter(
+            device=device,
+        ).exists())
+
+    @override_settings(INGEST_MAX_CLOCK_SKEW=60, INGEST_MAX_BACKFILL_AGE=3600)
+    def test_create_value_capture_time_skew(self):
+        """Test capture times outside the accepted window are rejected"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+        now = timezone.now()
+
+        for taken_at in [now + timedelta(minutes=5), now - timedelta(hours=2)]:
+            res = self.client.post(url, {
+                'value': 2,
+                'taken_at': taken_at.isoformat(),
+            })
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('taken_at', res.data)
+        self.assertFalse(DeviceValue.objects.exists())
+
+    def test_latest_value_by_capture_time(self):
+        """Test a backfilled reading does not become the latest value"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+        self.client.post(url, {'value': 4})
+        self.client.post(url, {
+            'value': 1,
+            'taken_at': (timezone.now() - timedelta(hours=1)).isoformat(),
+        })
+
+        res = self.client.get(reverse_latest_value(device.id))
+
+        self.assertEqual(res.data['value'], 4)
+
+    def test_create_value_buffered_capture_time(self):
+        """Test spooled readings keep their capture or acceptance time"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+        taken_at = timezone.now() - timedelta(hours=2)
+
+        with tempfile.TemporaryDirectory() as spool_dir:
+            spool = os.path.join(spool_dir, 'spool.sqlite3')
+            with override_settings(INGEST_BUFFER_PATH=spool):
+                self.client.post(url, {
+                    'value': 1,
+                    'taken_at': taken_at.isoformat(),
+                })
+                accepted = timezone.now()
+                self.client.post(url, {'value': 2})
+                # The flusher runs an hour behind
+                with patch(
+                    'django.utils.timezone.now',
+                    return_value=accepted + timedelta(hours=1),
+                ):
+                    call_command('flush_ingest_buffer', '--once')
+
+        self.assertEqual(DeviceValue.objects.get(value=1).taken_at, taken_at)
+        self.assertLess(
+            DeviceValue.objects.get(value=2).taken_at - accepted,
+            timedelta(minutes=1),
+        )
+
+    def test_create_value_msgpack(self):
+        """Test a reading packed as a MessagePack array"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+        taken_at = timezone.now() - timedelta(minutes=5)
+
+        res = self.client.post(
+            url,
+            msgpack.packb([3, 2, 5, 1, 1, taken_at], datetime=True),
+            content_type='application/vnd.curious.reading+msgpack',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        device_value = DeviceValue.objects.get(id=res.data['id'])
+        self.assertEqual(device_value.value, 3)
+        self.assertEqual(device_value.car_count, 2)
+        self.assertEqual(device_value.motorcycle_count, 5)
+        self.assertEqual(device_value.bigvehicle_count, 1)
+        self.assertEqual(device_value.taken_at, taken_at)
+
+    def test_create_value_msgpack_invalid(self):
+        """Test malformed packed readings are rejected"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+
+        for body in [b'\xc1', msgpack.packb([1, 2]), msgpack.packb([9] * 5)]:
+            res = self.client.post(
+                url,
+                body,
+                content_type='application/vnd.curious.reading+msgpack',
+            )
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DeviceValue.objects.exists())
+
+    def test_create_values_bulk(self):
+        """Test a batch of readings is stored at once"""
+        device = create_device(user=self.user)
+        taken_at = (timezone.now() - timedelta(hours=1)).timestamp()
+        readings = [
+            [1, 0, 0, 0, 0, taken_at, 'reading-1'],
+            [2, 1, 1, 1, 1],
+            [1, 0, 0, 0, 0, taken_at, 'reading-1'],
+        ]
+
+        res = self.client.post(
+            reverse_bulk(device.id),
+            msgpack.packb(readings),
+            content_type='application/vnd.curious.reading+msgpack',
+            HTTP_IDEMPOTENCY_KEY='batch',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data, {'count': 2, 'duplicates': ['reading-1']})
+        values = device.values.order_by('taken_at')
+        self.assertEqual([value.value for value in values], [1, 2])
+        self.assertEqual(values[0].idempotency_key, 'reading-1')
+        self.assertIsNone(values[1].idempotency_key)
+
+    def test_create_values_bulk_retry(self):
+        """Test a retried batch reports the readings already stored"""
+        device = create_device(user=self.user)
+        readings = [
+            {'value': 1, 'idempotency_key': 'reading-1'},
+            {'value': 2, 'idempotency_key': 'reading-2'},
+        ]
+        self.client.post(reverse_bulk(device.id), readings[:1], format='json')
+
+        url = reverse_bulk(device.id)
+        res = self.client.post(url, readings, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data, {'count': 1, 'duplicates': ['reading-1']})
+        self.assertEqual(device.values.count(), 2)
+
+    def test_create_values_bulk_json_invalid(self):
+        """Test a batch with an invalid reading stores nothing"""
+        device = create_device(user=self.user)
+
+        res = self.client.post(
+            reverse_bulk(device.id),
+            [{'value': 1}, {'value': 6}],
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DeviceValue.objects.exists())
+
+    def test_create_values_bulk_other_user_device(self):
+        """Test batches cannot be written into another user's device"""
+        other_user = create_user(
+            email='other@rayhank.com',
+            password='changeme123',
+        )
+        device = create_device(user=other_user)
+
+        res = self.client.post(
+            reverse_bulk(device.id),
+            [{'value': 1}],
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(DeviceValue.objects.exists())
+
+    def test_create_value_other_user_device(self):
+        """Test that values cannot be written into another user's device"""
+        other_user = create_user(
+            email='other@rayhank.com',
+            password='changeme123',
+        )
+        device = create_device(user=other_user)
+
+        url = reverse_value(device_id=device.id, action='list')
+        res = self.client.post(url, {'value': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(DeviceValue.objects.filter(device=device).exists())
+
+    @override_settings(CACHES=SHARED_CACHE)
+    def test_create_value_device_lookup_cached(self):
+        """Test that repeated readings skip the device lookup query"""
+        cache.clear()
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+        self.client.post(url, {'value': 1})
+
+        with self.assertNumQueries(1):
+            res = self.client.post(url, {'value': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['device']['id'], device.id)
+
+    def test_create_value_process_cache_checks_owner(self):
+        """Test a per-process cache never authorises a reassigned device"""
+        other_user = create_user(
+            email='other@rayhank.com',
+            password='changeme123',
+        )
+        device = create_device(user=self.user)
+        # As cached by a worker that missed the reassignment
+        cache.set(ownership.device_cache_key(device.id), device)
+        IoTDevice.objects.filter(id=device.id).update(user=other_user)
+
+        url = reverse_value(device_id=device.id, action='list')
+        res = self.client.post(url, {'value': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_value_marks_hour_dirty(self):
+        """Test deleting a reading has its hour rolled up again"""
+        device = create_device(user=self.user)
+        value = DeviceValue.objects.create(
+            user=self.user,
+            device=device,
+            value=3,
+            taken_at=timezone.now() - timedelta(hours=2),
+        )
+
+        res = self.client.delete(
+            reverse_value(device_id=device.id, value_id=value.id),
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(
+            DeviceTrafficDirtyHour.objects.filter(device=device).exists()
+        )
+
     def test_change_value(self):
         """Test changing a device value is allowed"""
         device = create_device(user=self.user)
@@ -269,7 +801,7 @@ class PrivateDeviceApiTests(TestCase):
             DeviceValue.objects.create(
                 user=self.user,
                 device=device,
-                value=i,
+                value=i % 5 + 1,
                 motorcycle_count=i,
                 car_count=i,
                 smalltruck_count=i,
@@ -311,6 +843,114 @@ class PrivateDeviceApiTests(TestCase):
         self.assertEqual(results[0]['id'], sorted_values[0].id)
         self.assertEqual(results[-1]['id'], sorted_values[-1].id)
 
+    def test_get_values_query_count(self):
+        """Test listing values does not query the device per row"""
+        device = create_device(user=self.user)
+        DeviceValue.objects.bulk_create([
+            DeviceValue(user=self.user, device=device, value=i % 6)
+            for i in range(50)
+        ])
+        url = reverse_value(device_id=device.id, action='list')
+
+        # Device lookup, count and page
+        with self.assertNumQueries(3):
+            res = self.client.get(url, {'page_size': 50})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 50)
+        self.assertEqual(res.data['results'][0]['device']['id'], device.id)
+
+    def test_get_values_page_size_limited(self):
+        """Test the page size requested by clients is capped"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+        DeviceValue.objects.bulk_create([
+            DeviceValue(user=self.user, device=device, value=1)
+            for _ in range(1001)
+        ])
+
+        res = self.client.get(url, {'page_size': 5000})
+
+        self.assertEqual(len(res.data['results']), 1000)
+
+    def test_get_values_sparse_fields(self):
+        """Test values can be rendered with only some fields"""
+        device = create_device(user=self.user)
+        DeviceValue.objects.create(user=self.user, device=device, value=2)
+        url = reverse_value(device_id=device.id, action='list')
+
+        res = self.client.get(url, {'fields': 'value,taken_at'})
+        self.assertEqual(set(res.data['results'][0]), {'value', 'taken_at'})
+
+        res = self.client.get(url, {'omit': 'image,device'})
+        self.assertNotIn('image', res.data['results'][0])
+        self.assertNotIn('device', res.data['results'][0])
+        self.assertIn('car_count', res.data['results'][0])
+
+    def test_get_values_collapsed_device(self):
+        """Test an explicit expand list collapses the device to its id"""
+        device = create_device(user=self.user)
+        DeviceValue.objects.create(user=self.user, device=device, value=2)
+        url = reverse_value(device_id=device.id, action='list')
+
+        res = self.client.get(url, {'expand': ''})
+        self.assertEqual(res.data['results'][0]['device'], device.id)
+
+        res = self.client.get(url, {'expand': 'device'})
+        self.assertEqual(res.data['results'][0]['device']['id'], device.id)
+
+    def test_create_value_ignores_sparse_fields(self):
+        """Test sparse fieldsets do not change what writes accept"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+
+        res = self.client.post(
+            f'{url}?fields=id',
+            {'value': 3, 'car_count': 2},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(DeviceValue.objects.get(device=device).car_count, 2)
+
+    def test_get_values_columnar(self):
+        """Test retrieving device values as columns"""
+        device = create_device(user=self.user)
+        for i in range(1, 4):
+            DeviceValue.objects.create(
+                user=self.user,
+                device=device,
+                value=i,
+                car_count=i * 2,
+            )
+
+        url = reverse_value(device_id=device.id, action='list')
+        res = self.client.get(
+            url,
+            HTTP_ACCEPT='application/vnd.curious.columnar+json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        data = json.loads(res.content)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['results']['value'], [3, 2, 1])
+        self.assertEqual(data['results']['car_count'], [6, 4, 2])
+        self.assertEqual(data['results']['device.id'], [device.id] * 3)
+
+    def test_get_values_columnar_msgpack(self):
+        """Test retrieving device values as MessagePack columns"""
+        device = create_device(user=self.user)
+        DeviceValue.objects.create(user=self.user, device=device, value=4)
+
+        url = reverse_value(device_id=device.id, action='list')
+        res = self.client.get(
+            url,
+            HTTP_ACCEPT='application/vnd.curious.columnar+msgpack',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        data = msgpack.unpackb(res.content)
+        self.assertEqual(data['results']['value'], [4])
+
     def test_device_serializer_latest_value(self):
         """Test that the device serializer includes the latest value"""
         device = create_device(user=self.user)
@@ -419,6 +1059,87 @@ class ImageUploadTests(TestCase):
         res = self.client.post(url, payload, format='multipart')
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @override_settings(UPLOAD_SIZE_LIMITS={'image': 100})
+    def test_upload_image_too_large(self):
+        """Test that images over the size limit are rejected"""
+        url = reverse_image(self.device.id, self.device_value.id)
+        image_file = io.BytesIO(b'x' * 1000)
+        image_file.name = 'large.jpg'
+        res = self.client.post(url, {'image': image_file}, format='multipart')
+
+        self.assertEqual(
+            res.status_code,
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+        self.device_value.refresh_from_db()
+        self.assertFalse(self.device_value.image)
+
+    def test_upload_image_checksum_mismatch(self):
+        """Test that an image not matching its checksum is rejected"""
+        url = reverse_image(self.device.id, self.device_value.id)
+        image_file = io.BytesIO(jpeg_bytes())
+        image_file.name = 'image.jpg'
+        res = self.client.post(
+            url,
+            {'image': image_file},
+            format='multipart',
+            HTTP_X_CONTENT_SHA256='0' * 64,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_resumable_image_upload(self):
+        """Test uploading an image in chunks"""
+        url = reverse_resumable_image(self.device.id, self.device_value.id)
+        data = jpeg_bytes()
+        half = len(data) // 2
+        headers = {
+            'HTTP_UPLOAD_LENGTH': str(len(data)),
+            'HTTP_UPLOAD_FILENAME': 'camera.jpg',
+        }
+
+        res = self.client.patch(
+            url,
+            data[:half],
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET='0',
+            **headers,
+        )
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res['Upload-Offset'], str(half))
+
+        res = self.client.get(url)
+        self.assertEqual(res.data['offset'], half)
+
+        res = self.client.patch(
+            url,
+            data[half:],
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(half),
+            HTTP_X_CONTENT_SHA256=hashlib.sha256(data).hexdigest(),
+            **headers,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.device_value.refresh_from_db()
+        self.assertTrue(self.device_value.image.name.endswith('.jpg'))
+        with self.device_value.image.open('rb') as image:
+            self.assertEqual(image.read(), data)
+        self.assertEqual(self.client.get(url).data['offset'], 0)
+
+    def test_resumable_image_offset_mismatch(self):
+        """Test that a chunk sent at the wrong offset is rejected"""
+        url = reverse_resumable_image(self.device.id, self.device_value.id)
+        res = self.client.patch(
+            url,
+            b'abc',
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET='10',
+            HTTP_UPLOAD_LENGTH='100',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
     def test_latest_value_include_image(self):
         """Test that hitting latest value include image"""
         device = create_device(user=self.user)
@@ -448,3 +1169,289 @@ class ImageUploadTests(TestCase):
         self.assertIn('/static/media/uploads/images', latest_value['image'])
 
         device_value.image.delete()
+
+
+class ThrottleTests(TestCase):
+    """Test rate limits on ingest and public reads"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='throttle@rayhank.com',
+            password='changeme',
+        )
+        self.client.force_authenticate(self.user)
+
+        patchers = [
+            patch.object(throttling, 'buckets', throttling.LocalBuckets()),
+            patch.object(
+                throttling.TokenBucketThrottle,
+                'THROTTLE_RATES',
+                {
+                    'device_ingest': '2/min',
+                    'token_ingest': '5/min',
+                    'latest_value': '1/min',
+                },
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_device_ingest_limited(self):
+        """Test values for one device are limited per device"""
+        device = create_device(user=self.user)
+        other_device = create_device(user=self.user, device_name='Other')
+        url = reverse_value(device_id=device.id, action='list')
+
+        for _ in range(2):
+            res = self.client.post(url, {'value': 1})
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res = self.client.post(url, {'value': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        self.assertEqual(DeviceValue.objects.filter(device=device).count(), 2)
+
+        # Reads are not ingest
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        other_url = reverse_value(device_id=other_device.id, action='list')
+        res = self.client.post(other_url, {'value': 1})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_ingest_limited_per_reading(self):
+        """Test a batch takes a token for each of its readings"""
+        device = create_device(user=self.user)
+
+        res = self.client.post(
+            reverse_bulk(device.id),
+            [{'value': 1}] * 3,
+            format='json',
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.client.post(
+            reverse_bulk(device.id),
+            [{'value': 1}],
+            format='json',
+        )
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(DeviceValue.objects.filter(device=device).count(), 3)
+
+    def test_token_ingest_limited(self):
+        """Test values written with one token are limited across devices"""
+        devices = [
+            create_device(user=self.user, device_name=f'Device {i}')
+            for i in range(6)
+        ]
+
+        codes = [
+            self.client.post(
+                reverse_value(device_id=device.id, action='list'),
+                {'value': 1},
+            ).status_code
+            for device in devices
+        ]
+
+        self.assertEqual(codes, [status.HTTP_201_CREATED] * 5 + [
+            status.HTTP_429_TOO_MANY_REQUESTS,
+        ])
+
+        # A device key does not share the bucket of its owner's token
+        _, key = DeviceAPIKey.objects.create_key(devices[-1])
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Device {key}')
+        res = client.post(
+            reverse_value(device_id=devices[-1].id, action='list'),
+            {'value': 1},
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_other_user_cannot_drain_device(self):
+        """Test requests for a device of another user use their own bucket"""
+        device = create_device(user=self.user)
+        url = reverse_value(device_id=device.id, action='list')
+        other_user = create_user(
+            email='other-throttle@rayhank.com',
+            password='changeme123',
+        )
+        other_client = APIClient()
+        other_client.force_authenticate(other_user)
+
+        for _ in range(2):
+            other_client.post(url, {'value': 1})
+        res = self.client.post(url, {'value': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_latest_value_limited_per_ip(self):
+        """Test public latest value reads are limited per client IP"""
+        device = create_device(user=self.user)
+        DeviceValue.objects.create(user=self.user, device=device, value=3)
+        client = APIClient()
+        url = reverse_latest_value(device.id)
+
+        res = client.get(url, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = client.get(
+            url,
+            REMOTE_ADDR='10.0.0.1',
+            HTTP_X_FORWARDED_FOR='10.0.0.2',
+        )
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        res = client.get(url, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class DeviceAPIKeyTests(TestCase):
+    """Test devices writing readings with their own API keys"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='keys@rayhank.com',
+            password='changeme',
+        )
+        self.client.force_authenticate(self.user)
+        self.device = create_device(user=self.user)
+        self.values_url = reverse_value(self.device.id, action='list')
+
+    def create_key(self, device=None):
+        """Create a key through the API and return the response data"""
+        res = self.client.post(
+            reverse_api_keys((device or self.device).id),
+            {'name': 'camera'},
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data
+
+    def device_client(self, key):
+        """Return a client authenticated with a device key"""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Device {key}')
+        return client
+
+    def test_create_and_list_keys(self):
+        """Test the secret is only returned when a key is created"""
+        data = self.create_key()
+
+        self.assertTrue(data['key'].startswith(f"{data['prefix']}."))
+        api_key = DeviceAPIKey.objects.get(id=data['id'])
+        self.assertNotIn(data['key'].split('.')[1], api_key.digest)
+
+        res = self.client.get(reverse_api_keys(self.device.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([key['id'] for key in res.data], [data['id']])
+        self.assertNotIn('key', res.data[0])
+
+    def test_other_user_cannot_manage_keys(self):
+        """Test keys of another user's device are not reachable"""
+        other_user = create_user(
+            email='other@rayhank.com',
+            password='changeme123',
+        )
+        device = create_device(user=other_user)
+
+        res = self.client.post(reverse_api_keys(device.id), {})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(DeviceAPIKey.objects.exists())
+
+    @override_settings(CACHES=SHARED_CACHE)
+    def test_write_value_with_key(self):
+        """Test a device key writes readings as the device's owner"""
+        cache.clear()
+        client = self.device_client(self.create_key()['key'])
+        client.post(self.values_url, {'value': 1})
+
+        # Key and device come from the cache, only the insert is left
+        with self.assertNumQueries(1):
+            res = client.post(self.values_url, {'value': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            DeviceValue.objects.get(id=res.data['id']).user,
+            self.user,
+        )
+
+    def test_key_limited_to_ingest_on_its_device(self):
+        """Test a device key cannot read or write other devices"""
+        other_device = create_device(user=self.user, device_name='Other')
+        client = self.device_client(self.create_key()['key'])
+
+        res = client.get(self.values_url)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        res = client.post(
+            reverse_value(other_device.id, action='list'),
+            {'value': 1},
+        )
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        res = client.get(DEVICE_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalid_key(self):
+        """Test wrong secrets and malformed keys are rejected"""
+        data = self.create_key()
+
+        for key in [f"{data['prefix']}.wrong", 'nonsense', '']:
+            res = self.device_client(key).post(self.values_url, {'value': 1})
+            self.assertEqual(
+                res.status_code,
+                status.HTTP_401_UNAUTHORIZED,
+            )
+        self.assertFalse(DeviceValue.objects.exists())
+
+    def test_revoke_key(self):
+        """Test a revoked key stops working right away"""
+        data = self.create_key()
+        client = self.device_client(data['key'])
+        client.post(self.values_url, {'value': 1})
+
+        res = self.client.delete(reverse_api_keys(self.device.id, data['id']))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(res.data['revoked_at'])
+
+        res = client.post(self.values_url, {'value': 1})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_rotate_key(self):
+        """Test rotating replaces a key with a new one of the same name"""
+        data = self.create_key()
+
+        res = self.client.post(reverse_api_keys(self.device.id, data['id']))
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['name'], 'camera')
+        old = self.device_client(data['key'])
+        res_old = old.post(self.values_url, {'value': 1})
+        self.assertEqual(res_old.status_code, status.HTTP_401_UNAUTHORIZED)
+        new = self.device_client(res.data['key'])
+        res_new = new.post(self.values_url, {'value': 1})
+        self.assertEqual(res_new.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(CACHES=SHARED_CACHE)
+    def test_deactivated_owner_rejected_at_once(self):
+        """Test a cached key stops working when its owner is deactivated"""
+        cache.clear()
+        client = self.device_client(self.create_key()['key'])
+        client.post(self.values_url, {'value': 1})
+
+        self.user.is_active = False
+        self.user.save()
+        res = client.post(self.values_url, {'value': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_process_cache_keeps_no_keys(self):
+        """Test a per-process cache never serves a key revoked elsewhere"""
+        client = self.device_client(self.create_key()['key'])
+        client.post(self.values_url, {'value': 1})
+
+        # Revoked through another worker, no signal reaches this one
+        DeviceAPIKey.objects.update(revoked_at=timezone.now())
+        res = client.post(self.values_url, {'value': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
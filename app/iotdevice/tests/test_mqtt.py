@@ -0,0 +1,134 @@
+"""
+Tests for the MQTT ingestion gateway
+"""
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+
+from core.models import IoTDevice, DeviceAPIKey, DeviceValue
+from iotdevice.mqtt import Gateway
+
+
+class GatewayTests(TestCase):
+    """Test validating and batching MQTT readings"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='example@rayhank.com',
+            password='changeme',
+        )
+        self.device = IoTDevice.objects.create(
+            user=self.user,
+            device_name='ESP32',
+        )
+        _, self.key = DeviceAPIKey.objects.create_key(self.device)
+        self.topic = f'devices/{self.device.id}/values'
+        self.gateway = Gateway(batch_size=3, interval=60)
+        self.sent = 0
+        self.acked = []
+
+    def send(self, payload, topic=None):
+        """Hand the gateway a message, recording when it is acknowledged"""
+        mid = self.sent
+        self.sent += 1
+        self.gateway.handle(
+            topic or self.topic,
+            payload,
+            lambda: self.acked.append(mid),
+        )
+
+    def publish(self, topic=None, key=None, **data):
+        """Send a reading authenticated with the device's key"""
+        self.send(json.dumps({'key': key or self.key, **data}), topic)
+
+    def test_readings_stored_in_batches(self):
+        """Test readings are inserted and acknowledged per batch"""
+        self.publish(value=1, car_count=2)
+        self.publish(value=2)
+
+        self.assertFalse(DeviceValue.objects.exists())
+        self.assertEqual(self.acked, [])
+
+        self.publish(value=3)
+
+        self.assertEqual(
+            sorted(DeviceValue.objects.values_list('value', flat=True)),
+            [1, 2, 3],
+        )
+        self.assertEqual(self.acked, [0, 1, 2])
+        value = DeviceValue.objects.get(value=1)
+        self.assertEqual(value.device, self.device)
+        self.assertEqual(value.car_count, 2)
+
+    def test_invalid_messages_acknowledged_in_order(self):
+        """Test rejected messages are dropped but acknowledged in order"""
+        other = get_user_model().objects.create_user(
+            email='other@rayhank.com',
+            password='changeme',
+        )
+        other_device = IoTDevice.objects.create(user=other, device_name='X')
+
+        self.publish(value=9)
+        self.publish(topic=f'devices/{other_device.id}/values', value=1)
+        self.send(b'{"value": 1}')
+        self.send(b'not json')
+        self.publish(value=4)
+        self.gateway.flush()
+
+        self.assertEqual(
+            list(DeviceValue.objects.values_list('value', flat=True)),
+            [4],
+        )
+        self.assertEqual(self.acked, [0, 1, 2, 3, 4])
+
+    def test_key_limited_to_its_device(self):
+        """Test a key cannot write to another device, even the owner's"""
+        other_device = IoTDevice.objects.create(
+            user=self.user,
+            device_name='Other',
+        )
+        api_key, other_key = DeviceAPIKey.objects.create_key(other_device)
+        prefix = other_key.partition('.')[0]
+
+        self.publish(topic=f'devices/{other_device.id}/values', value=1)
+        self.publish(key=f'{prefix}.forged', value=2)
+        # The owner's account token is no device key
+        self.publish(key=Token.objects.create(user=self.user).key, value=3)
+        api_key.revoke()
+        self.publish(
+            topic=f'devices/{other_device.id}/values',
+            key=other_key,
+            value=4,
+        )
+        self.gateway.flush()
+
+        self.assertFalse(DeviceValue.objects.exists())
+        self.assertEqual(self.acked, [0, 1, 2, 3])
+
+    def test_unknown_key_cached(self):
+        """Test a repeated unknown key is rejected without a query"""
+        self.publish(key='deadbeef.forged', value=1)
+
+        with self.assertNumQueries(0):
+            self.publish(key='deadbeef.forged', value=1)
+
+    def test_duplicate_key_stored_once(self):
+        """Test redelivered readings with a key are stored once"""
+        self.publish(value=1, idempotency_key='reading-1')
+        self.gateway.flush()
+        self.publish(value=1, idempotency_key='reading-1')
+        self.gateway.flush()
+
+        self.assertEqual(DeviceValue.objects.count(), 1)
+
+    def test_discard_pending(self):
+        """Test readings of a lost connection are neither stored nor acked"""
+        self.publish(value=1)
+
+        self.gateway.discard()
+        self.gateway.flush()
+
+        self.assertFalse(DeviceValue.objects.exists())
+        self.assertEqual(self.acked, [])
@@ -0,0 +1,67 @@
+"""
+Rate limits for device value ingest and public reads
+"""
+from core.models import DeviceAPIKey
+from core.throttling import TokenBucketThrottle, WriteTokenBucketThrottle
+
+
+class IngestThrottle(WriteTokenBucketThrottle):
+    """Limit readings rather than requests, a batch takes one per reading"""
+
+    def get_cost(self, request, view):
+        if getattr(view, 'action', None) == 'bulk' and isinstance(
+            request.data, list,
+        ):
+            return max(1, len(request.data))
+        return 1
+
+
+class DeviceIngestThrottle(IngestThrottle):
+    """Limit the values written to one device.
+
+    The bucket is per user and device, so requests for a device someone
+    else owns (which fail with 404 anyway) cannot drain its bucket.
+    """
+    scope = 'device_ingest'
+
+    def get_cache_key(self, request, view):
+        device = view.kwargs.get('device_pk')
+        if device is None or not request.user.is_authenticated:
+            return None
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': f'{request.user.pk}-{device}',
+        }
+
+
+class TokenIngestThrottle(IngestThrottle):
+    """Limit the values written with one credential, across its devices.
+
+    Each device API key has its own bucket. The account token is shared
+    by all devices of its owner, who has one bucket for it.
+    """
+    scope = 'token_ingest'
+
+    def get_cache_key(self, request, view):
+        if not request.user.is_authenticated:
+            return None
+        if isinstance(request.auth, DeviceAPIKey):
+            ident = f'key-{request.auth.pk}'
+        else:
+            # A user has exactly one token, and the pk keeps it out of memory
+            ident = f'user-{request.user.pk}'
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': ident,
+        }
+
+
+class LatestValueThrottle(TokenBucketThrottle):
+    """Limit public latest-value reads per client IP"""
+    scope = 'latest_value'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request),
+        }
@@ -1,7 +1,17 @@
 """
 Views for IoT Device app
 """
-from drf_spectacular.utils import extend_schema, OpenApiParameter
+import io
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.shortcuts import get_object_or_404
+from drf_spectacular.utils import (
+    extend_schema,
+    extend_schema_view,
+    OpenApiParameter,
+)
 from rest_framework import (
     viewsets,
     status,
@@ -10,15 +20,43 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.settings import api_settings
 
+from core import rollups, uploads
+from core.caching import cache_publicly
+from core.mixins import (
+    ConditionalGetMixin,
+    SparseFieldsMixin,
+    SPARSE_FIELDS_PARAMETERS,
+)
 from core.models import (
     IoTDevice,
+    DeviceAPIKey,
     DeviceValue,
 )
-from iotdevice import serializers
+from iotdevice import buffer, ownership, serializers
+from iotdevice.authentication import DeviceAPIKeyAuthentication
+from iotdevice.pagination import DeviceValuePagination
+from iotdevice.parsers import ReadingMsgPackParser
+from iotdevice.permissions import DeviceKeyScope
+from iotdevice.renderers import (
+    ColumnarJSONRenderer,
+    ColumnarMsgPackRenderer,
+)
+from iotdevice.throttling import (
+    DeviceIngestThrottle,
+    LatestValueThrottle,
+    TokenIngestThrottle,
+)
 
 
-class DeviceViewSet(viewsets.ModelViewSet):
+@extend_schema_view(
+    list=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+)
+class DeviceViewSet(SparseFieldsMixin,
+                    ConditionalGetMixin,
+                    viewsets.ModelViewSet):
     """View for manage IoT Device API"""
     queryset = IoTDevice.objects.all().order_by('-id')
     serializer_class = serializers.DeviceSerializer
@@ -35,46 +73,139 @@ class DeviceViewSet(viewsets.ModelViewSet):
         """Return serializer class for requests"""
         return self.serializer_class
 
+    def get_watermark(self, queryset):
+        """Include the latest value of each device, as they render it"""
+        # One index lookup per device on devicevalue_device_taken_idx
+        # instead of joining every value. The sum changes whenever the
+        # latest value of a device does, new or deleted; edits of a value
+        # bump the device's updated_at (iotdevice.signals).
+        latest = DeviceValue.objects.filter(
+            device=OuterRef('pk'),
+        ).order_by('-taken_at').values('pk')[:1]
+        return queryset.annotate(
+            latest_value=Subquery(latest),
+        ).aggregate(
+            count=Count('pk'),
+            last_pk=Max('pk'),
+            updated=Max('updated_at'),
+            latest_values=Sum('latest_value'),
+        )
+
     def perform_create(self, serializer):
         """Create a new device"""
         serializer.save(user=self.request.user)
 
+    @extend_schema(parameters=SPARSE_FIELDS_PARAMETERS)
     @action(detail=True,
             methods=['get'],
             url_path='latest-value',
-            permission_classes=[AllowAny])
+            permission_classes=[AllowAny],
+            throttle_classes=[LatestValueThrottle])
     def latest_value(self, request, pk=None):
         """Retrieve the latest value for a specific device"""
         try:
             device = IoTDevice.objects.get(pk=pk)
         except IoTDevice.DoesNotExist:
-            return Response(
+            return cache_publicly(Response(
                 {'detail': 'Device not found.'},
                 status=status.HTTP_404_NOT_FOUND
-            )
+            ))
 
         latest_value = device.values.order_by('-taken_at').first()
 
         if latest_value:
             serializer = serializers.DeviceValueSerializer(
                 latest_value,
-                context={'request': request}
+                context={'request': request},
+                **self.get_sparse_fields()
             )
-            return Response(serializer.data)
+            return cache_publicly(
+                Response(serializer.data),
+                f'device-{device.pk}',
+            )
+
+        return cache_publicly(
+            Response(
+                {
+                    'detail': 'No values found for this device.'
+                },
+                status=status.HTTP_404_NOT_FOUND
+            ),
+            f'device-{device.pk}',
+        )
 
+    @extend_schema(
+        request=serializers.DeviceAPIKeySerializer,
+        responses={
+            200: serializers.DeviceAPIKeySerializer(many=True),
+            201: serializers.NewDeviceAPIKeySerializer,
+        },
+    )
+    @action(detail=True, methods=['get', 'post'], url_path='api-keys',
+            pagination_class=None)
+    def api_keys(self, request, pk=None):
+        """List the device's API keys or create one"""
+        device = self.get_object()
+        if request.method == 'GET':
+            return Response(serializers.DeviceAPIKeySerializer(
+                device.api_keys.order_by('-created_at'),
+                many=True,
+            ).data)
+
+        serializer = serializers.DeviceAPIKeySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self._new_key(device, serializer.validated_data.get('name'))
+
+    @extend_schema(request=None, responses={
+        200: serializers.DeviceAPIKeySerializer,
+        201: serializers.NewDeviceAPIKeySerializer,
+    })
+    @action(detail=True, methods=['post', 'delete'],
+            url_path=r'api-keys/(?P<key_id>[0-9]+)')
+    def api_key(self, request, pk=None, key_id=None):
+        """Revoke an API key, or rotate it to a new one with POST"""
+        device = self.get_object()
+        api_key = get_object_or_404(device.api_keys, pk=key_id)
+        api_key.revoke()
+        if request.method == 'POST':
+            return self._new_key(device, api_key.name)
+        return Response(serializers.DeviceAPIKeySerializer(api_key).data)
+
+    def _new_key(self, device, name):
+        """Create an API key and respond with its only readable copy"""
+        api_key, key = DeviceAPIKey.objects.create_key(device, name or '')
+        api_key.key = key
         return Response(
-            {
-                'detail': 'No values found for this device.'
-            },
-            status=status.HTTP_404_NOT_FOUND
+            serializers.NewDeviceAPIKeySerializer(api_key).data,
+            status=status.HTTP_201_CREATED,
         )
 
 
-class DeviceValueViewSet(viewsets.ModelViewSet):
+class DeviceValueViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """View for managing Device Values"""
     serializer_class = serializers.DeviceValueSerializer
-    authentication_classes = [TokenAuthentication]
-    permission_classes = [IsAuthenticated]
+    authentication_classes = [
+        TokenAuthentication,
+        DeviceAPIKeyAuthentication,
+    ]
+    permission_classes = [IsAuthenticated, DeviceKeyScope]
+    pagination_class = DeviceValuePagination
+    throttle_classes = [DeviceIngestThrottle, TokenIngestThrottle]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [
+        ColumnarJSONRenderer,
+        ColumnarMsgPackRenderer,
+    ]
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES + [
+        ReadingMsgPackParser,
+    ]
+
+    # What a device API key may do, on its own device only
+    device_key_actions = {
+        'create',
+        'bulk',
+        'upload_image',
+        'resumable_image',
+    }
 
     # Set the lookup fields
     lookup_field = 'id'
@@ -82,23 +213,129 @@ class DeviceValueViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Retrieve values for specific devices"""
-        device_id = self.kwargs.get('device_pk')
+        if getattr(self, 'swagger_fake_view', False):
+            return DeviceValue.objects.none()
+
         order_direction = self.request.query_params.get('order_direction', 'last')  # Default to last
 
-        queryset = DeviceValue.objects.filter(
-            device__id=device_id,
-            user=self.request.user
-        ).order_by('-taken_at')
+        # Going through the device's related manager hands every row the
+        # already loaded device, so serializing the nested device costs no
+        # query per row. Ownership was checked on the device, which makes
+        # a filter (and index lookup) on user unnecessary.
+        queryset = self.get_device().values.order_by('-taken_at')
 
         if order_direction == 'first':
             queryset = queryset.reverse()
 
         return queryset
 
+    def get_device(self):
+        """Return the device from the URL, owned by the requesting user"""
+        if not hasattr(self, '_device'):
+            self._device = ownership.get_owned_device(
+                self.request.user,
+                self.kwargs.get('device_pk'),
+            )
+        return self._device
+
+    @extend_schema(parameters=[
+        OpenApiParameter(
+            name=serializers.IDEMPOTENCY_HEADER,
+            location=OpenApiParameter.HEADER,
+            description='Key unique per reading of the device; a retry '
+                        'with the same key returns the stored reading.',
+            required=False,
+            type=str,
+        ),
+    ])
+    def create(self, request, *args, **kwargs):
+        """Create a device value, or spool it when ingestion is buffered"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # A retry of a stored reading gets the original back, unchanged
+        key = serializer.validated_data.get('idempotency_key')
+        if key:
+            original = self.get_device().values.filter(
+                idempotency_key=key,
+            ).first()
+            if original:
+                return Response(
+                    self.get_serializer(original).data,
+                    status=status.HTTP_200_OK,
+                )
+
+        if not buffer.is_enabled() or serializer.validated_data.get('image'):
+            # Files cannot be spooled, readings with one are stored now
+            self.perform_create(serializer)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        buffer.append(
+            self.get_device(),
+            request.user,
+            serializer.validated_data,
+        )
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    def perform_destroy(self, instance):
+        """Delete a reading and mark the hour it was rolled up in dirty"""
+        with transaction.atomic():
+            instance.delete()
+            rollups.mark_dirty([instance])
+
+    @extend_schema(
+        request=serializers.DeviceValueSerializer(many=True),
+        responses={201: serializers.BulkResultSerializer},
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request, device_pk=None):
+        """Store a batch of readings with a single insert"""
+        if not isinstance(request.data, list):
+            return Response(
+                {'detail': 'Expected a list of readings.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(request.data) > settings.INGEST_BULK_MAX_READINGS:
+            return Response(
+                {'detail': 'Send at most '
+                           f'{settings.INGEST_BULK_MAX_READINGS} readings '
+                           'per batch.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        device = self.get_device()
+
+        # Readings whose key is already stored, or repeated in the batch,
+        # are retries: only the first one is kept. A retry racing this
+        # batch is still skipped by the constraint, ON CONFLICT DO NOTHING.
+        seen = set(device.values.filter(idempotency_key__in={
+            data['idempotency_key']
+            for data in serializer.validated_data
+            if data.get('idempotency_key')
+        }).values_list('idempotency_key', flat=True))
+        values = []
+        duplicates = []
+        for data in serializer.validated_data:
+            key = data.get('idempotency_key')
+            if key in seen:
+                duplicates.append(key)
+                continue
+            if key:
+                seen.add(key)
+            values.append(
+                DeviceValue(device=device, user=request.user, **data),
+            )
+        buffer.insert_values(values)
+        return Response(
+            {'count': len(values), 'duplicates': duplicates},
+            status=status.HTTP_201_CREATED,
+        )
+
     def perform_create(self, serializer):
         """Create a new device value with the associated device"""
-        device_id = self.kwargs.get('device_pk')
-        device = IoTDevice.objects.get(id=device_id)
+        device = self.get_device()
         serializer.save(user=self.request.user, device=device)
 
     def get_serializer_class(self):
@@ -124,6 +361,78 @@ class DeviceValueViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='Upload-Offset',
+                location=OpenApiParameter.HEADER,
+                description='Bytes of the image already received.',
+                type=int,
+            ),
+            OpenApiParameter(
+                name='Upload-Length',
+                location=OpenApiParameter.HEADER,
+                description='Total size of the image in bytes.',
+                type=int,
+            ),
+        ],
+        request={'application/offset+octet-stream': bytes},
+    )
+    @action(methods=['GET', 'PATCH'], detail=True,
+            url_path='upload-image/resumable')
+    def resumable_image(self, request, device_pk=None, pk=None):
+        """Upload an image in chunks, resuming from the last offset"""
+        device_value = self.get_object()
+        upload = uploads.ResumableUpload(
+            f'devicevalue-{device_value.id}',
+            'image',
+        )
+        if request.method == 'GET':
+            return Response(
+                {'offset': upload.offset},
+                headers={'Upload-Offset': upload.offset},
+            )
+
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            total = int(request.headers['Upload-Length'])
+        except (KeyError, ValueError):
+            return Response(
+                {'detail': 'Upload-Offset and Upload-Length are required.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        with upload.lock():
+            offset = upload.append(
+                offset,
+                request.stream or io.BytesIO(),
+                total,
+            )
+            if offset < total:
+                return Response(
+                    {'offset': offset},
+                    status=status.HTTP_202_ACCEPTED,
+                    headers={'Upload-Offset': offset},
+                )
+
+            image = upload.open(
+                request.headers.get('Upload-Filename', 'image'),
+            )
+            try:
+                uploads.check_checksum(request, upload.sha256())
+                serializer = serializers.ImageSerializer(
+                    device_value,
+                    data={'image': image},
+                    partial=True,
+                    context=self.get_serializer_context(),
+                )
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+            finally:
+                image.close()
+                upload.discard()
+        return Response(serializer.data, headers={'Upload-Offset': offset})
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -134,7 +443,7 @@ class DeviceValueViewSet(viewsets.ModelViewSet):
                 type=str,
                 enum=['first', 'last']
             )
-        ]
+        ] + SPARSE_FIELDS_PARAMETERS
     )
     def list(self, request, *args, **kwargs):
         """Retrieve a list of device values"""
@@ -5,6 +5,7 @@ from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
 from core.models import ToDoList
+from core.serializers import DynamicFieldsMixin
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -61,11 +62,20 @@ class AuthTokenSerializer(serializers.Serializer):
         return attrs
 
 
-class TodoSerializer(serializers.ModelSerializer):
+class TodoListSerializer(serializers.ListSerializer):
+    """Serializer creating many todos with a single INSERT"""
+
+    def create(self, validated_data):
+        todos = [ToDoList(**attrs) for attrs in validated_data]
+        return ToDoList.objects.bulk_create(todos)
+
+
+class TodoSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for the Todo model"""
 
     class Meta:
         model = ToDoList
+        list_serializer_class = TodoListSerializer
         fields = [
             'id',
             'user',
@@ -86,3 +96,72 @@ class TodoSerializer(serializers.ModelSerializer):
             }
         }
         read_only_fields = ['id', 'user', 'created_at']
+
+
+class TodoIdsSerializer(serializers.Serializer):
+    """Serializer for a set of todo ids"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=1000,
+    )
+
+
+class TodoBulkUpdateSerializer(serializers.ModelSerializer):
+    """Serializer for one item of a bulk todo update"""
+    id = serializers.IntegerField()
+
+    class Meta:
+        model = ToDoList
+        fields = [
+            'id',
+            'title',
+            'description',
+            'due_date',
+            'is_completed',
+        ]
+
+    def validate(self, attrs):
+        """Require the id even though the update is partial"""
+        if 'id' not in attrs:
+            raise serializers.ValidationError(
+                {'id': _('This field is required.')},
+                code='required',
+            )
+        return attrs
+
+
+class TodoSetUpdateSerializer(serializers.ModelSerializer):
+    """Serializer applying the same changes to a set of todos"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=1000,
+    )
+
+    class Meta:
+        model = ToDoList
+        fields = [
+            'ids',
+            'title',
+            'description',
+            'due_date',
+            'is_completed',
+        ]
+
+    def validate(self, attrs):
+        """Require the ids even though the update is partial"""
+        if 'ids' not in attrs:
+            raise serializers.ValidationError(
+                {'ids': _('This field is required.')},
+                code='required',
+            )
+        return attrs
+
+
+class TodoFilterSerializer(serializers.Serializer):
+    """Serializer validating the todo list query parameters"""
+    is_completed = serializers.BooleanField(required=False)
+    overdue = serializers.BooleanField(required=False)
+    due_after = serializers.DateTimeField(required=False)
+    due_before = serializers.DateTimeField(required=False)
@@ -2,8 +2,11 @@
 Test for user API
 """
 
+from datetime import timedelta
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 from django.urls import reverse
 
@@ -17,6 +20,7 @@ CREATE_USER_URL = reverse("user:create")
 TOKEN_URL = reverse("user:token")
 PERSON_URL = reverse("user:person")
 TODO_LIST_URL = reverse("user:todo-list")
+TODO_BULK_URL = reverse("user:todo-bulk")
 
 
 def todo_detail_url(todo_id):
@@ -204,6 +208,18 @@ class PrivateUserTests(TestCase):
         self.assertEqual(len(results_data), len(serializer.data))  # pastikan jumlahnya sama
         self.assertEqual(results_data, serializer.data)
 
+    def test_retrieve_todo_list_omit_fields(self):
+        """Test todos can be listed without some fields"""
+        ToDoList.objects.create(user=self.user, title='Todo')
+
+        res = self.client.get(TODO_LIST_URL, {'omit': 'description,user'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        todo = res.data['results'][0]
+        self.assertNotIn('description', todo)
+        self.assertNotIn('user', todo)
+        self.assertEqual(todo['title'], 'Todo')
+
     def test_create_todo(self):
         """Test creating todo"""
         payload = {
@@ -294,3 +310,157 @@ class PrivateUserTests(TestCase):
 
         self.assertEqual(len(results_data), 1)
         self.assertEqual(results_data[0]['title'], todo.title)
+
+    def test_todo_detail_not_modified(self):
+        """Test that an unchanged todo answers 304 to its ETag"""
+        todo = ToDoList.objects.create(
+            user=self.user,
+            title='Cached todo',
+            description='Cached desc',
+        )
+        url = todo_detail_url(todo.id)
+
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        etag = res['ETag']
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=f'W/{etag}')
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(url, {'title': 'Changed todo'})
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_bulk_create_todos(self):
+        """Test creating many todos in one request"""
+        payload = [
+            {'title': 'First', 'description': 'one'},
+            {'title': 'Second', 'description': 'two'},
+        ]
+        res = self.client.post(TODO_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 2)
+        todos = ToDoList.objects.filter(user=self.user)
+        self.assertEqual(
+            sorted(todos.values_list('title', flat=True)),
+            ['First', 'Second'],
+        )
+
+    def test_bulk_update_todos(self):
+        """Test updating many todos with per item changes"""
+        todo1 = ToDoList.objects.create(user=self.user, title='One')
+        todo2 = ToDoList.objects.create(user=self.user, title='Two')
+        payload = [
+            {'id': todo1.id, 'is_completed': True},
+            {'id': todo2.id, 'title': 'Renamed'},
+        ]
+        res = self.client.patch(TODO_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        todo1.refresh_from_db()
+        todo2.refresh_from_db()
+        self.assertTrue(todo1.is_completed)
+        self.assertEqual(todo2.title, 'Renamed')
+        self.assertFalse(todo2.is_completed)
+
+    def test_bulk_complete_todos(self):
+        """Test applying the same change to a set of todos"""
+        todos = [
+            ToDoList.objects.create(user=self.user, title=f'Todo {i}')
+            for i in range(3)
+        ]
+        payload = {
+            'ids': [todo.id for todo in todos[:2]],
+            'is_completed': True,
+        }
+        res = self.client.patch(TODO_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 2)
+        completed = ToDoList.objects.filter(is_completed=True)
+        self.assertEqual(
+            set(completed.values_list('id', flat=True)),
+            set(payload['ids']),
+        )
+
+    def test_bulk_delete_todos(self):
+        """Test deleting many todos in one request"""
+        todo1 = ToDoList.objects.create(user=self.user, title='One')
+        todo2 = ToDoList.objects.create(user=self.user, title='Two')
+        keep = ToDoList.objects.create(user=self.user, title='Keep')
+
+        res = self.client.delete(
+            TODO_BULK_URL,
+            {'ids': [todo1.id, todo2.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        remaining = ToDoList.objects.filter(user=self.user)
+        self.assertEqual(list(remaining), [keep])
+
+    def test_bulk_operations_limited_to_user(self):
+        """Test bulk changes cannot touch another user's todos"""
+        other_user = create_user(
+            email='other@example.com',
+            password='password123',
+        )
+        mine = ToDoList.objects.create(user=self.user, title='Mine')
+        other = ToDoList.objects.create(user=other_user, title='Other')
+        payload = {'ids': [mine.id, other.id], 'is_completed': True}
+
+        res = self.client.patch(TODO_BULK_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        res = self.client.delete(
+            TODO_BULK_URL,
+            {'ids': [other.id]},
+            format='json',
+        )
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        mine.refresh_from_db()
+        self.assertFalse(mine.is_completed)
+        self.assertTrue(ToDoList.objects.filter(id=other.id).exists())
+
+    def test_filter_todos(self):
+        """Test filtering todos by completion and due date"""
+        now = timezone.now()
+        overdue = ToDoList.objects.create(
+            user=self.user,
+            title='Overdue',
+            due_date=now - timedelta(days=1),
+        )
+        ToDoList.objects.create(
+            user=self.user,
+            title='Done',
+            due_date=now - timedelta(days=1),
+            is_completed=True,
+        )
+        upcoming = ToDoList.objects.create(
+            user=self.user,
+            title='Upcoming',
+            due_date=now + timedelta(days=3),
+        )
+
+        res = self.client.get(TODO_LIST_URL, {'overdue': 'true'})
+        ids = [todo['id'] for todo in res.data['results']]
+        self.assertEqual(ids, [overdue.id])
+
+        res = self.client.get(TODO_LIST_URL, {'is_completed': 'false'})
+        ids = {todo['id'] for todo in res.data['results']}
+        self.assertEqual(ids, {overdue.id, upcoming.id})
+
+        res = self.client.get(TODO_LIST_URL, {
+            'due_after': now.isoformat(),
+            'due_before': (now + timedelta(days=7)).isoformat(),
+        })
+        ids = [todo['id'] for todo in res.data['results']]
+        self.assertEqual(ids, [upcoming.id])
+
+    def test_filter_todos_invalid(self):
+        """Test that invalid filter values are rejected"""
+        res = self.client.get(TODO_LIST_URL, {'due_before': 'tomorrow'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,17 +1,34 @@
+from django.db import transaction
+from django.utils import timezone
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import (
     generics,
     permissions,
     authentication, viewsets,
+    status,
 )
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
     TodoSerializer,
+    TodoIdsSerializer,
+    TodoBulkUpdateSerializer,
+    TodoSetUpdateSerializer,
+    TodoFilterSerializer,
 )
 
+from core.mixins import (
+    ConditionalGetMixin,
+    SparseFieldsMixin,
+    SPARSE_FIELDS_PARAMETERS,
+)
 from core.models import ToDoList
 
 
@@ -37,7 +54,9 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
         return self.request.user
 
 
-class TodoViewSet(viewsets.ModelViewSet):
+class TodoViewSet(SparseFieldsMixin,
+                  ConditionalGetMixin,
+                  viewsets.ModelViewSet):
     """ViewSet for managing ToDo List (CRUD)"""
     serializer_class = TodoSerializer
     authentication_classes = [authentication.TokenAuthentication]
@@ -45,8 +64,144 @@ class TodoViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Return objects for the current authenticated user only"""
-        return ToDoList.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = ToDoList.objects.filter(
+            user=self.request.user
+        ).order_by('-created_at')
+        if self.action == 'list':
+            queryset = self._filter_list(queryset)
+        return queryset
+
+    def _filter_list(self, queryset):
+        """Apply the list query parameters to the queryset"""
+        filters = TodoFilterSerializer(data=self.request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        params = filters.validated_data
+
+        if 'is_completed' in params:
+            queryset = queryset.filter(is_completed=params['is_completed'])
+        if 'due_after' in params:
+            queryset = queryset.filter(due_date__gte=params['due_after'])
+        if 'due_before' in params:
+            queryset = queryset.filter(due_date__lt=params['due_before'])
+        if params.get('overdue'):
+            queryset = queryset.filter(
+                is_completed=False,
+                due_date__lt=timezone.now(),
+            )
+        return queryset
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='is_completed',
+                description="Only return completed (true) "
+                            "or open (false) todos.",
+                required=False,
+                type=bool,
+            ),
+            OpenApiParameter(
+                name='overdue',
+                description="Only return open todos "
+                            "whose due date has passed.",
+                required=False,
+                type=bool,
+            ),
+            OpenApiParameter(
+                name='due_after',
+                description='Only return todos due at or after this time.',
+                required=False,
+                type=OpenApiTypes.DATETIME,
+            ),
+            OpenApiParameter(
+                name='due_before',
+                description='Only return todos due before this time.',
+                required=False,
+                type=OpenApiTypes.DATETIME,
+            ),
+        ] + SPARSE_FIELDS_PARAMETERS
+    )
+    def list(self, request, *args, **kwargs):
+        """Retrieve a filtered list of todos"""
+        return super().list(request, *args, **kwargs)
+
+    def get_serializer_class(self):
+        """Return appropriate serializer class"""
+        if self.action == 'bulk_update':
+            if isinstance(self.request.data, list):
+                return TodoBulkUpdateSerializer
+            return TodoSetUpdateSerializer
+        if self.action == 'bulk_destroy':
+            return TodoIdsSerializer
+        return self.serializer_class
 
     def perform_create(self, serializer):
         """Create a new ToDoList"""
         serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=['post'], url_path='bulk', url_name='bulk')
+    def bulk_create(self, request):
+        """Create many todos in one request"""
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        """Update many todos, either per item or with shared changes"""
+        many = isinstance(request.data, list)
+        serializer = self.get_serializer(
+            data=request.data,
+            many=many,
+            partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        now = timezone.now()
+
+        if many:
+            changes = {
+                item.pop('id'): item for item in serializer.validated_data
+            }
+            todos = list(self.get_queryset().filter(id__in=changes))
+            self._check_found(changes, todos)
+            fields = {'updated_at'}
+            for todo in todos:
+                for field, value in changes[todo.id].items():
+                    setattr(todo, field, value)
+                    fields.add(field)
+                todo.updated_at = now
+            with transaction.atomic():
+                ToDoList.objects.bulk_update(todos, list(fields))
+        else:
+            changes = dict(serializer.validated_data)
+            ids = changes.pop('ids')
+            todos = self.get_queryset().filter(id__in=ids)
+            with transaction.atomic():
+                self._check_found(ids, todos)
+                todos.update(updated_at=now, **changes)
+
+        return Response(TodoSerializer(
+            todos,
+            many=True,
+            context=self.get_serializer_context(),
+        ).data)
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request):
+        """Delete many todos in one request"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        with transaction.atomic():
+            todos = self.get_queryset().filter(id__in=ids)
+            self._check_found(ids, todos)
+            todos.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def _check_found(self, ids, todos):
+        """Raise NotFound unless every id is one of the user's todos"""
+        found = {todo.id for todo in todos}
+        missing = sorted(set(ids) - found)
+        if missing:
+            raise NotFound(f'Todos not found: {missing}')
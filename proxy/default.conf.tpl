@@ -1,3 +1,8 @@
+# Shared cache for public read endpoints. Django decides what may be
+# cached and for how long through Cache-Control.
+uwsgi_cache_path /var/cache/nginx/api levels=1:2 keys_zone=api:10m
+                 max_size=100m inactive=10m use_temp_path=off;
+
 server {
     listen ${LISTEN_PORT};
 
@@ -5,19 +10,62 @@ server {
         alias /vol/static;
     }
 
+    # Media is private: the app checks ownership and answers with an
+    # X-Accel-Redirect into the internal location below.
     location /static/media {
-        alias /vol/web/media;
+        add_header Access-Control-Allow-Origin "${FRONTEND_DOMAIN}" always;
+        add_header Access-Control-Allow-Methods "GET, OPTIONS" always;
+        add_header Access-Control-Allow-Headers "Authorization" always;
+
+        uwsgi_pass ${APP_HOST}:${APP_PORT};
+        include /etc/nginx/uwsgi_params;
+    }
+
+    location /protected-media/ {
+        internal;
+        alias /vol/web/media/;
+    }
+
+    # Every map viewer polls the same latest values. The cache lock lets
+    # one request per device through to the app while the rest wait for
+    # its response, and stale copies are served while it refreshes.
+    location ~ ^/api/user/device/[0-9]+/latest-value/$ {
+        add_header Access-Control-Allow-Origin "${FRONTEND_DOMAIN}" always;
+        add_header Access-Control-Allow-Methods "GET, OPTIONS" always;
+        add_header Access-Control-Allow-Headers "Authorization, Content-Type" always;
+        add_header X-Cache-Status $upstream_cache_status always;
+
+        uwsgi_pass ${APP_HOST}:${APP_PORT};
+        include /etc/nginx/uwsgi_params;
+
+        uwsgi_cache api;
+        uwsgi_cache_key $scheme$host$request_uri;
+        uwsgi_cache_lock on;
+        uwsgi_cache_lock_timeout 5s;
+        uwsgi_cache_use_stale updating error timeout http_500 http_503;
+        uwsgi_cache_background_update on;
     }
 
     location / {
         add_header Access-Control-Allow-Origin "${FRONTEND_DOMAIN}" always;
         add_header Access-Control-Allow-Methods "GET, POST, OPTIONS" always;
-        add_header Access-Control-Allow-Headers "Authorization, Content-Type" always;
+        add_header Access-Control-Allow-Headers "Authorization, Content-Type, Idempotency-Key" always;
 
         uwsgi_pass ${APP_HOST}:${APP_PORT};
         include /etc/nginx/uwsgi_params;
         client_max_body_size 30M;
 
+        gzip on;
+        gzip_vary on;
+        gzip_proxied any;
+        gzip_comp_level 5;
+        gzip_min_length ${GZIP_MIN_LENGTH};
+        gzip_types
+            application/json
+            application/vnd.oai.openapi
+            application/vnd.oai.openapi+json
+            application/vnd.curious.columnar+json;
+
     }
 }
 
@@ -1,5 +1,7 @@
 #!/bin/sh
 set -e
 
-envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
+# Only substitute our settings, the template also uses nginx variables
+envsubst '${LISTEN_PORT} ${APP_HOST} ${APP_PORT} ${FRONTEND_DOMAIN} ${GZIP_MIN_LENGTH}' \
+    < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
 nginx -g 'daemon off;'
\ No newline at end of file
@@ -2,8 +2,45 @@
 
 set -e
 
+# Volumes created before uploads were streamed lack the temporary directory.
+mkdir -p /vol/web/media/.uploads
+
 python manage.py wait_for_db
-python manage.py collectstatic --noinput
-python manage.py migrate
+python manage.py collectstatic_if_changed
+python manage.py generate_schema
+
+# Set RUN_MIGRATIONS=0 when a separate init step applies migrations.
+if [ "${RUN_MIGRATIONS:-1}" = "1" ]; then
+    python manage.py migrate --check > /dev/null 2>&1 || python manage.py migrate
+fi
+
+# uWSGI process model. These are deliberately not named UWSGI_*, since
+# uWSGI would read those as options of its own.
+workers=${SERVER_WORKERS:-4}
+if [ "$workers" = "auto" ]; then
+    workers=$(( $(nproc) * 2 ))
+fi
+
+set -- \
+    --socket :9000 \
+    --master \
+    --enable-threads \
+    --workers "$workers" \
+    --threads "${SERVER_THREADS:-1}" \
+    --listen "${SERVER_LISTEN:-100}" \
+    --harakiri "${SERVER_HARAKIRI:-0}" \
+    --max-requests "${SERVER_MAX_REQUESTS:-5000}" \
+    --cache2 "name=throttle,items=${SERVER_THROTTLE_ITEMS:-10000},blocksize=16" \
+    --module app.wsgi
+
+if [ -n "$SERVER_RELOAD_ON_RSS" ]; then
+    set -- "$@" --reload-on-rss "$SERVER_RELOAD_ON_RSS"
+fi
+if [ "${SERVER_LAZY_APPS:-0}" = "1" ]; then
+    set -- "$@" --lazy-apps
+fi
+if [ -n "$SERVER_STATS" ]; then
+    set -- "$@" --stats "$SERVER_STATS" --stats-http
+fi
 
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
+exec uwsgi "$@"